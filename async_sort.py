@@ -0,0 +1,127 @@
+"""Sorting YAML documents read from asyncio streams.
+
+`sort_stream` reads a whole stream, sorts it in an executor (so the event
+loop keeps serving other streams while documents are loaded, sorted and
+dumped) and writes the result:
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    limit = asyncio.Semaphore(16)
+
+    async def handle(reader, writer):
+        await sort_stream(reader, writer, executor=executor, limit=limit)
+        writer.close()
+
+    await asyncio.start_unix_server(handle, path)
+
+`limit` bounds the number of documents being read, sorted or written
+at the same time. Streams waiting for it are not read at all, so their
+senders are paused by the transport instead of filling the memory.
+
+Threads overlap sorting with I/O of other streams, use processes to sort
+in parallel. Forked processes keep copies of sockets open at the moment
+they are started, so peers don't get EOF until they exit: start them with
+"forkserver" or "spawn" (`mp_context` of `ProcessPoolExecutor`).
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import Any
+
+# Size of chunks to read from streams
+_CHUNK_SIZE = 2**16
+
+# `ruamel.yaml.YAML` instances can't be shared between threads
+_local = threading.local()
+
+
+def _sort_text(text: str, minimal_diff: bool, options: dict[str, Any]) -> str:
+    """Sort documents with the `YAML` instance of the current thread.
+
+    It runs in worker threads (or processes), see `sort_stream`.
+    """
+    import ruamel.yaml
+    from yaml_sort import sort_text
+
+    yaml = getattr(_local, "yaml", None)
+    if yaml is None:
+        yaml = _local.yaml = ruamel.yaml.YAML()
+    yaml.allow_duplicate_keys = options.get("unique", False)
+    try:
+        return sort_text(yaml, text, minimal_diff, **options)
+    except Exception:
+        # the instance can't be used after an error in the middle of `dump_all`
+        _local.yaml = None
+        raise
+
+
+async def read_stream(reader: asyncio.StreamReader, max_size: int | None = None) -> str:
+    """Read the whole stream as UTF-8 text.
+
+    Raises:
+        ValueError: if the stream is longer than `max_size` bytes
+    """
+    chunks = []
+    size = 0
+    while chunk := await reader.read(_CHUNK_SIZE):
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise ValueError(f"document is larger than {max_size} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks).decode("utf-8")
+
+
+async def sort_stream(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    *,
+    executor: Executor | None = None,
+    limit: asyncio.Semaphore | None = None,
+    max_size: int | None = None,
+    minimal_diff: bool = False,
+    **options,
+) -> None:
+    """Read YAML documents from `reader`, sort them and write to `writer`.
+
+    Loading, sorting and dumping run in `executor`, so the event loop isn't
+    blocked. The writer is drained but not closed.
+
+    Args:
+        reader (asyncio.StreamReader): source documents, read until EOF
+        writer (asyncio.StreamWriter): destination for sorted documents
+        executor (Executor | None): executor for sorting, by default the one
+            of the event loop; with a process pool key functions in `options`
+            must be picklable
+        limit (asyncio.Semaphore | None): semaphore shared by all streams,
+            the stream is read, sorted and written while holding it
+        max_size (int | None): the longest stream in bytes
+        minimal_diff (bool): move lines of the source if possible
+            (see `yaml_sort.sort_text`)
+        **options: arguments for `deep_sort`
+
+    Raises:
+        ValueError: if the stream is longer than `max_size`
+        ruamel.yaml.YAMLError: if documents can't be loaded
+    """
+    if limit is None:
+        await _sort_stream(reader, writer, executor, max_size, minimal_diff, options)
+        return
+    async with limit:
+        await _sort_stream(reader, writer, executor, max_size, minimal_diff, options)
+
+
+async def _sort_stream(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    executor: Executor | None,
+    max_size: int | None,
+    minimal_diff: bool,
+    options: dict[str, Any],
+) -> None:
+    text = await read_stream(reader, max_size)
+    loop = asyncio.get_running_loop()
+    target = await loop.run_in_executor(
+        executor, _sort_text, text, minimal_diff, options
+    )
+    writer.write(target.encode("utf-8"))
+    await writer.drain()
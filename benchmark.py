@@ -0,0 +1,420 @@
+"""Benchmark for sorting YAML documents with comments.
+
+Synthetic documents of different shapes and sizes are loaded, checked with
+`check_sorted`, sorted with `deep_sort` and dumped. Time and peak memory are
+reported for every phase separately. Phase "splice" is the whole `splice_sort`
+(load, sort and moving lines of the source), an alternative to the other ones.
+
+Usage:
+
+    python benchmark.py [--shapes SHAPE ...] [--sizes N ...] [--json FILE]
+    python benchmark.py --scaling [--sizes N ...]
+    python benchmark.py --startup [--import-budget RATIO]
+
+Time is the best of `--repeat` runs, memory is measured with `tracemalloc`
+in a separate run (it slows down the code a lot). Time of garbage collection
+is the mean over the timed runs. Documents are sorted with `pause_gc` as
+`yaml_sort.py` does.
+
+`--scaling` sorts sequences built in memory (loading of millions of items
+takes too long) and reports time per item, it should stay about the same
+(growing as `log n` at most) for every size.
+
+`--startup` runs `yaml_sort.py` in new interpreters with `-X importtime`:
+with `--help`, without files and with one file. `--import-budget` makes
+it fail if imports take longer than the given ratio of the startup of
+`python -c pass` on the same machine (or `ruamel.yaml` is imported) without
+files.
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+
+import ruamel.yaml
+from comments_sort import check_sorted, deep_sort, pause_gc, seq_sort_before
+from ruamel.yaml.comments import CommentedSeq
+from ruamel.yaml.error import CommentMark
+from ruamel.yaml.tokens import CommentToken
+from text_splice import splice_sort
+
+# Generated documents are the same for every run
+SEED = 42
+
+
+def _shuffled(n: int) -> list[int]:
+    items = list(range(n))
+    random.Random(SEED).shuffle(items)
+    return items
+
+
+def wide_map(n: int) -> str:
+    """Map with `n` keys without comments."""
+    return "".join(f"key{i:07d}: value {i}\n" for i in _shuffled(n))
+
+
+def long_seq(n: int) -> str:
+    """Sequence with `n` items without comments."""
+    return "".join(f"- item {i:07d}\n" for i in _shuffled(n))
+
+
+def nested(n: int) -> str:
+    """Maps with 10 keys nested until there are about `n` keys in total."""
+    lines = []
+    fanout = 10
+
+    def add(level: int, count: int) -> None:
+        indent = "  " * level
+        for i in _shuffled(fanout):
+            if count <= fanout:
+                lines.append(f"{indent}key{i}: value {i}\n")
+            else:
+                lines.append(f"{indent}key{i}:\n")
+                add(level + 1, count // fanout)
+
+    add(0, n)
+    return "".join(lines)
+
+
+def map_comments(n: int) -> str:
+    """Map with `n` keys with comments before and inline."""
+    return "".join(
+        f"# comment before {i}\nkey{i:07d}: value {i}  # inline {i}\n"
+        for i in _shuffled(n)
+    )
+
+
+def seq_comments(n: int) -> str:
+    """Sequence with `n` items with comments before and inline."""
+    return "".join(
+        f"# comment before {i}\n- item {i:07d}  # inline {i}\n" for i in _shuffled(n)
+    )
+
+
+def map_after_comments(n: int) -> str:
+    """Map with `n` keys with multi-line comments after inline comments."""
+    return "".join(
+        f"key{i:07d}: value {i}  # inline {i}\n# after {i}.1\n# after {i}.2\n"
+        for i in _shuffled(n)
+    )
+
+
+SHAPES: dict[str, Callable[[int], str]] = {
+    "wide-map": wide_map,
+    "long-seq": long_seq,
+    "nested": nested,
+    "map-comments": map_comments,
+    "seq-comments": seq_comments,
+    "map-after-comments": map_after_comments,
+}
+
+PHASES = ["load", "check", "sort", "dump", "splice"]
+
+
+class _GCTimer:
+    """Total time of garbage collections, see `gc.callbacks`."""
+
+    def __init__(self) -> None:
+        self.total = 0.0
+        self._start = 0.0
+
+    def __call__(self, phase: str, info: dict) -> None:
+        if phase == "start":
+            self._start = time.perf_counter()
+        else:
+            self.total += time.perf_counter() - self._start
+
+
+def _measure(func: Callable[[], object], repeat: int) -> tuple[float, int, float]:
+    """Get the best time, peak memory (in bytes) and GC time for `func`.
+
+    `func` is called `repeat` times for time and once more for memory.
+    """
+    best = float("inf")
+    gc_timer = _GCTimer()
+    gc.collect()
+    gc.callbacks.append(gc_timer)
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.callbacks.remove(gc_timer)
+
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak - base, gc_timer.total / repeat
+
+
+def run(shape: str, size: int, repeat: int = 3, inplace: bool = False) -> dict:
+    """Benchmark load, check, sort, dump and splice phases for one document.
+
+    Returns:
+        dict: time (seconds), peak memory (bytes) and GC time (seconds)
+            for every phase
+    """
+    yaml = ruamel.yaml.YAML()
+    text = SHAPES[shape](size)
+
+    def load():
+        return yaml.load(text)
+
+    # sorting changes the loaded document, so every run sorts a fresh copy
+    docs: list = []
+
+    def sort():
+        with pause_gc():
+            return deep_sort(docs.pop(), inplace=inplace)
+
+    loaded_doc = load()
+
+    def check():
+        return check_sorted(loaded_doc)
+
+    sorted_doc = deep_sort(load(), inplace=inplace)
+
+    def dump():
+        yaml.dump(sorted_doc, io.StringIO())
+
+    def splice():
+        with pause_gc():
+            assert splice_sort(yaml, text) is not None
+
+    result = dict(shape=shape, size=size, bytes=len(text))
+    for phase, func in zip(PHASES, [load, check, sort, dump, splice]):
+        if func is sort:
+            docs.extend(load() for _ in range(repeat + 1))
+        (
+            result[f"{phase}_time"],
+            result[f"{phase}_memory"],
+            result[f"{phase}_gc_time"],
+        ) = _measure(func, repeat)
+    return result
+
+
+def synthetic_seq(n: int) -> CommentedSeq:
+    """Sequence with `n` items with comments as `seq_comments` gives after loading.
+
+    Comment before the next item is a part of the inline comment.
+    """
+    items = _shuffled(n)
+    obj = CommentedSeq(f"item {i:07d}" for i in items)
+    obj.ca.comment = [None, [CommentToken("# comment before\n", CommentMark(0))]]
+    for index, i in enumerate(items):
+        value = f"# inline {i}\n"
+        if index < n - 1:
+            value += "# comment before\n"
+        obj.ca.items[index] = [CommentToken(value, CommentMark(16)), None, None, None]
+    return obj
+
+
+def run_scaling(size: int, repeat: int = 3) -> dict:
+    """Benchmark `seq_sort_before` for a sequence of `size` items.
+
+    Returns:
+        dict: the best time (seconds) and time per item (microseconds)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        obj = synthetic_seq(size)
+        start = time.perf_counter()
+        with pause_gc():
+            seq_sort_before(obj, inplace=True)
+        best = min(best, time.perf_counter() - start)
+    return dict(size=size, sort_time=best, item_us=best / size * 1e6)
+
+
+# Command line of `yaml_sort.py` for startup cases, "FILE" is a sorted file
+STARTUP_CASES = {
+    "help": ["--help"],
+    "no-files": [],
+    "one-file": ["--check", "FILE"],
+}
+# Cases which don't sort anything, see `--import-budget`
+NO_OP_CASES = ["help", "no-files"]
+
+
+def _imports(argv: list[str]) -> tuple[float, dict[str, int]]:
+    """Run Python with `-X importtime` and `argv`.
+
+    Returns:
+        tuple: wall time (seconds) and cumulative time (microseconds)
+            of top-level imports by module names
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv], capture_output=True, text=True
+    )
+    wall_time = time.perf_counter() - start
+    imports = {}
+    for line in process.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # nested imports are indented
+        if not name.startswith("  "):
+            imports[name.strip()] = int(cumulative)
+        else:
+            imports.setdefault(name.strip(), 0)
+    return wall_time, imports
+
+
+def measure_startup(argv: list[str], repeat: int = 3) -> dict:
+    """Benchmark startup of `yaml_sort.py` with command line `argv`.
+
+    Modules imported by the interpreter itself (`python -c pass`) are not counted.
+
+    Returns:
+        dict: the best wall time and time of imports (seconds), imported modules
+            and the best wall time of `python -c pass` (seconds)
+    """
+    baseline_time = float("inf")
+    for _ in range(repeat):
+        wall_time, baseline = _imports(["-c", "pass"])
+        baseline_time = min(baseline_time, wall_time)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "yaml_sort.py")
+    best_time = best_imports = float("inf")
+    modules: set[str] = set()
+    for _ in range(repeat):
+        wall_time, imports = _imports([script, *argv])
+        own = {name: us for name, us in imports.items() if name not in baseline}
+        best_time = min(best_time, wall_time)
+        best_imports = min(best_imports, sum(own.values()) / 1e6)
+        modules.update(own)
+    return dict(
+        argv=argv,
+        time=best_time,
+        import_time=best_imports,
+        modules=sorted(modules),
+        baseline_time=baseline_time,
+    )
+
+
+def run_startup(repeat: int = 3) -> dict[str, dict]:
+    """Benchmark startup of `yaml_sort.py` for every case of `STARTUP_CASES`."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sorted.yaml")
+        with open(path, "w") as f:
+            f.write("a: 1\nb: 2\n")
+        return {
+            case: measure_startup(
+                [path if arg == "FILE" else arg for arg in argv], repeat
+            )
+            for case, argv in STARTUP_CASES.items()
+        }
+
+
+def _run_startup(args: argparse.Namespace, results: list[dict]) -> int:
+    print(f"{'case':<10} {'wall ms':>10} {'import ms':>10} {'ruamel':>8}")
+    exit_code = 0
+    for case, result in run_startup(args.repeat).items():
+        results.append(dict(result, case=case))
+        ruamel = "ruamel.yaml" in result["modules"]
+        print(
+            f"{case:<10} {result['time'] * 1e3:>10.1f}"
+            f" {result['import_time'] * 1e3:>10.1f} {'yes' if ruamel else 'no':>8}"
+        )
+        if args.import_budget is not None and case in NO_OP_CASES:
+            # the same machine and interpreter without imports of the tool
+            budget = args.import_budget * result["baseline_time"]
+            if ruamel or result["import_time"] > budget:
+                print(
+                    f"{case}: over budget of {args.import_budget} x python -c pass"
+                    f" ({budget * 1e3:.1f} ms)"
+                )
+                exit_code = 1
+    return exit_code
+
+
+def _run_shapes(args: argparse.Namespace, results: list[dict]) -> None:
+    print(
+        f"{'shape':<20} {'size':>8}"
+        + "".join(
+            f" {phase + ' s':>10} {phase + ' MB':>10} {phase + ' gc':>10}"
+            for phase in PHASES
+        )
+    )
+    for shape in args.shapes:
+        for size in args.sizes:
+            result = run(shape, size, repeat=args.repeat, inplace=args.inplace)
+            results.append(result)
+            print(
+                f"{shape:<20} {size:>8}"
+                + "".join(
+                    f" {result[phase + '_time']:>10.4f}"
+                    f" {result[phase + '_memory'] / 2**20:>10.2f}"
+                    f" {result[phase + '_gc_time']:>10.4f}"
+                    for phase in PHASES
+                ),
+                flush=True,
+            )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--shapes", nargs="+", choices=SHAPES, default=list(SHAPES), metavar="SHAPE"
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=[1000, 10000], metavar="N"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--inplace", action="store_true", help="sort in place")
+    parser.add_argument("--json", metavar="FILE", help="save results to file")
+    parser.add_argument(
+        "--scaling", action="store_true", help="sort long sequences of `--sizes`"
+    )
+    parser.add_argument(
+        "--startup", action="store_true", help="measure startup of yaml_sort.py"
+    )
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        metavar="RATIO",
+        help="exit with 1 if imports without files take longer than RATIO times "
+        "the startup of `python -c pass` (with --startup)",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    exit_code = 0
+    if args.startup:
+        exit_code = _run_startup(args, results)
+    elif args.scaling:
+        print(f"{'size':>8} {'sort s':>10} {'item us':>10}")
+        for size in args.sizes:
+            result = run_scaling(size, repeat=args.repeat)
+            results.append(result)
+            print(
+                f"{size:>8} {result['sort_time']:>10.4f} {result['item_us']:>10.2f}",
+                flush=True,
+            )
+    else:
+        _run_shapes(args, results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
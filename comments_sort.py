@@ -1,16 +1,32 @@
+import gc
+import json
+import operator
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from collections.abc import Collection, Iterable, Iterator, Sequence
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import compress, count, islice, tee
 from typing import Any
 
 import ruamel.yaml
-from ruamel.yaml.comments import CommentedMap, CommentedSeq
+from ruamel.yaml.anchor import Anchor
+from ruamel.yaml.comments import (
+    CommentedMap,
+    CommentedSeq,
+    format_attrib,
+    merge_attrib,
+)
 from ruamel.yaml.error import CommentMark
+from ruamel.yaml.mergevalue import MergeValue
+from ruamel.yaml.tag import Tag
 from ruamel.yaml.tokens import CommentToken
-
-"""
-TODO:
-- [ ] Idea: DRY for `_get_map_comments` and `_get_seq_comments`.
-- [ ] Idea: DRY for `map_sort_before` and `seq_sort_before`.
-"""
+from yaml_paths import WILDCARD, KeyOrder, Unsorted, format_path, parse_path
 
 
 def _comment_tokens_to_str(
@@ -49,29 +65,17 @@ def _comment_tokens_to_str(
     return "".join(comments)
 
 
-def _merge_comment_tokens(tokens: list[CommentToken]) -> CommentToken:
-    assert len(tokens) > 0
-
-    if len(tokens) == 1:
-        return tokens[0]
-
-    return _copy_comment_token(
-        token=tokens[0],
-        value=_comment_tokens_to_str(tokens),
-    )
-
-
-@dataclass
+@dataclass(slots=True)
 class Comments:
     """Helper class for comments.
 
     It provides possibility to handle comments in the same way
-    for map and sequence items. It doesn't depend whether it
-    CommentToke or list of CommentToken.
+    for map and sequence items. Lists of `ruamel.yaml` are reused
+    as is if possible, so they must not be changed.
     """
 
     before: list[CommentToken] | None = None
-    inline: list[CommentToken] | None = None
+    inline: CommentToken | None = None
     after: list[CommentToken] | None = None
 
 
@@ -100,311 +104,1780 @@ def _get_comment_list(
     return comment_tokens
 
 
+def _append_comments(
+    token: CommentToken | None,
+    comment_tokens: list[CommentToken],
+) -> CommentToken:
+    """Append comment lines after an inline comment (or after the line without it).
+
+    Args:
+        token (CommentToken | None): inline comment, if any
+        comment_tokens (list[CommentToken]): comments for the following lines
+
+    Returns:
+        CommentToken: new inline comment
+    """
+    value = _comment_tokens_to_str(comment_tokens)
+    if token is None:
+        return _copy_comment_token(token=comment_tokens[0], value="\n" + value)
+    current = token.value
+    if not current.endswith("\n"):
+        current += "\n"
+    return _copy_comment_token(token=token, value=current + value)
+
+
 def _get_start_comments(
     comment_tokens: list[CommentToken] | None,
-) -> Comments:
-    """Get beginning comment (`.ca.comment`)."""
+) -> list[CommentToken] | None:
+    """Get comments before the first element (`.ca.comment[1]`).
 
-    res = Comments()
+    Beginning comment (`.ca.comment[0]`) stays at its place.
+    """
     if comment_tokens is None:
-        return res
+        return None
 
     assert len(comment_tokens) == 2
     assert comment_tokens[0] is None or isinstance(comment_tokens[0], CommentToken)
     assert comment_tokens[1] is None or isinstance(comment_tokens[1], list)
 
-    res.before = _get_comment_list(comment_tokens[0])
-    res.inline = _get_comment_list(comment_tokens[1])
-    return res
+    return comment_tokens[1] or None
 
 
-def _get_map_comments(
+def _split_inline_comment(
+    token: CommentToken,
+) -> tuple[CommentToken | None, CommentToken | None]:
+    """Split comment into comment for current element and comment after it.
+
+    `ruamel.yaml` keeps the following lines in the same token as the inline comment,
+    but they are "before" comments for the next element.
+
+    Returns:
+        tuple[CommentToken | None, CommentToken | None]: inline comment
+            and comment after current element
+    """
+    # first line - inline comment
+    # second line and others - for next elements
+    current, _, after = token.value.partition("\n")
+    if not after:
+        # no need to split "inline" comment
+        return (token if current else None), None
+
+    inline = None
+    if current:
+        inline = _copy_comment_token(token=token, value=current + "\n")
+    # start_mark and columns have new indent
+    return inline, CommentToken(
+        value=after,
+        start_mark=CommentMark(0),
+        end_mark=token.end_mark,
+        column=0,
+    )
+
+
+def _get_item_comments(
     comment_tokens: list[CommentToken] | None,
-) -> Comments:
-    """Get comments for map items.
+    inline_pos: int,
+) -> Comments | None:
+    """Get comments for map or sequence items.
+
+    Items' comments (`.ca.items`) are lists of 4 elements:
+    [1] - "before" comments, `inline_pos` - "inline" comment (2 for maps and
+    0 for sequences), [3] - comments after (between a key and nested block).
 
     Comment for current element is splitted into two: current element and after it.
-    """
 
-    res = Comments()
+    Returns:
+        Comments | None: comments or None if there are no comments
+    """
     if comment_tokens is None:
-        return res
+        return None
 
     assert len(comment_tokens) == 4
-    assert comment_tokens[0] is None
-    assert comment_tokens[2] is None or type(comment_tokens[2]) == CommentToken
+    assert comment_tokens[1] is None or isinstance(comment_tokens[1], list)
     assert comment_tokens[3] is None or isinstance(comment_tokens[3], list)
 
-    # "before" for map is in the [1]
-    res.before = _get_comment_list(comment_tokens[1])
-
-    # "inline" for map is in the [2]
-    s = _comment_tokens_to_str(comment_tokens[2])
-    if s is not None:
-        if "\n" not in s:
-            # no need to split "inline" comment
-            res.inline = _get_comment_list(comment_tokens[2])
-            return res
-
-        # first line - inline comment
-        # second line and others - for next elements
-        current_after: list[str | None] = s.split("\n", 1)
-        # replace with None if second line is empty
-        if len(current_after) > 1 and current_after[1] == "":
-            current_after[1] = None
-
-        if current_after[0]:
-            res.inline = [
-                _copy_comment_token(
-                    token=comment_tokens[2],
-                    value=current_after[0],
-                )
-            ]
-        if current_after[1]:
-            # start_mark and columns have new indent
-            res.after = [
-                CommentToken(
-                    value=current_after[1],
-                    start_mark=CommentMark(0),
-                    end_mark=comment_tokens[2].end_mark,
-                    column=0,
-                )
-            ]
+    before = comment_tokens[1] or None
+    inline = after = None
+
+    token = comment_tokens[inline_pos]
+    if token is not None:
+        assert type(token) == CommentToken
+        inline, after_token = _split_inline_comment(token)
+        if after_token is not None:
+            after = [after_token]
 
     if comment_tokens[3]:
-        if res.after is None:
-            res.after = []
-        res.after.extend(_get_comment_list(comment_tokens[3]))
+        after = after + comment_tokens[3] if after else comment_tokens[3]
 
-    return res
+    if before is None and inline is None and after is None:
+        return None
+    return Comments(before, inline, after)
 
 
-def map_sort_before(obj: CommentedMap, sorted_keys: list[Any]) -> CommentedMap:
-    """Sort map with comments before a block.
+def _is_container(value: Any) -> bool:
+    return isinstance(value, (CommentedMap, CommentedSeq))
+
+
+def _own_items(obj: CommentedMap) -> Iterable[tuple[Any, Any]]:
+    """Items of `obj` without items of merged maps (`<<: *anchor`).
+
+    `ruamel.yaml` adds keys of merged maps to the map itself for lookups,
+    but dumps the merge key instead of them.
+    """
+    if getattr(obj, merge_attrib, None):
+        return obj.non_merged_items()
+    # the same items, but without a lookup of every key by `CommentedMap`
+    return OrderedDict.items(obj)
+
+
+def _own_keys(obj: CommentedMap) -> Collection[Any]:
+    """Keys of `obj` in order, see `_own_items`."""
+    if getattr(obj, merge_attrib, None):
+        return dict(obj.non_merged_items()).keys()
+    return obj
+
+
+def _last_item(obj: CommentedMap | CommentedSeq) -> tuple[Any, int] | None:
+    """Get key (or index) of the last item and position of its inline comment."""
+    if not obj:
+        return None
+    if isinstance(obj, CommentedMap):
+        keys = _own_keys(obj)
+        return (next(reversed(keys)), 2) if keys else None
+    return len(obj) - 1, 0
+
+
+def _is_anchored(obj: CommentedMap | CommentedSeq) -> bool:
+    anchor = getattr(obj, Anchor.attrib, None)
+    return anchor is not None and anchor.value is not None
+
+
+def _copy_container(
+    obj: CommentedMap | CommentedSeq,
+    merged: list[CommentedMap] | None = None,
+) -> CommentedMap | CommentedSeq:
+    """Copy a container to change it without changing the source.
+
+    Values are not copied, comments of the container itself are.
 
     Args:
-        obj (CommentedMap): source object
-        sorted_keys (list[Any]): list of keys for resulting map
+        obj (CommentedMap | CommentedSeq): source object
+        merged (list[CommentedMap] | None): maps for merge keys (`<<`) instead
+            of the source ones
+    """
+    target: CommentedMap | CommentedSeq
+    if isinstance(obj, CommentedMap):
+        target = CommentedMap(_own_items(obj))
+    else:
+        target = CommentedSeq(obj)
+    _copy_attributes(obj, target, merged)
+    # lists of tokens are copied too, tokens are shared
+    if obj.ca.comment is not None:
+        target.ca.comment = _copy_lists(obj.ca.comment)
+    for key, comment_tokens in obj.ca.items.items():
+        target.ca.items[key] = _copy_lists(comment_tokens)
+    if obj.ca.end:
+        target.ca.end = list(obj.ca.end)
+    return target
+
+
+def _copy_lists(comment_tokens: list[Any]) -> list[Any]:
+    return [list(x) if isinstance(x, list) else x for x in comment_tokens]
+
+
+def _with_blocks(
+    obj: CommentedMap | CommentedSeq,
+    blocks: dict[Any, Any],
+    merged: list[CommentedMap] | None = None,
+) -> CommentedMap | CommentedSeq:
+    """Put sorted nested blocks to a copy of `obj`, see `_sort_before`.
+
+    Maps for merge keys can be replaced with `merged` too.
+    """
+    if not blocks and merged is None:
+        return obj
+    target = _copy_container(obj, merged)
+    for key, value in blocks.items():
+        target[key] = value
+    return target
+
+
+def _seq_items(obj: CommentedSeq, blocks: dict[int, Any] | None) -> Sequence[Any]:
+    """Items of a sequence with sorted nested blocks, see `_sort_before`."""
+    if not blocks:
+        return obj
+    items = list(obj)
+    for index, value in blocks.items():
+        items[index] = value
+    return items
+
+
+def _pop_trailing_comments(
+    obj: Any, inplace: bool
+) -> tuple[Any, list[CommentToken] | None]:
+    """Detach comments placed after a nested block.
+
+    `ruamel.yaml` attaches such comments to the deepest last item of the block,
+    but they refer to the element following the block in the parent.
+
+    Args:
+        obj (Any): value of a parent's item.
+        inplace (bool): change the block itself instead of copying containers
+            down to its deepest last item (blocks with anchors are not copied,
+            they keep their comments then)
 
     Returns:
-        CommentedMap: target object
+        tuple[Any, list[CommentToken] | None]: `obj` (or its copy) and
+            detached comments, if any.
     """
-    assert isinstance(obj, CommentedMap)
+    if not _is_container(obj):
+        return obj, None
+    last = _last_item(obj)
+    if last is None or (not inplace and _is_anchored(obj)):
+        return obj, None
+    key, pos = last
+    value = obj[key]
+    if _is_container(value):
+        value, res = _pop_trailing_comments(value, inplace)
+        if value is not obj[key]:
+            obj = _copy_container(obj)
+            obj[key] = value
+        return obj, res
+
+    comment_tokens = obj.ca.items.get(key)
+    if comment_tokens is None:
+        return obj, None
+    token = comment_tokens[pos]
+    inline, after = _split_inline_comment(token) if token is not None else (None, None)
+    trailing = comment_tokens[3] if pos == 2 else None
+    if not after and not trailing:
+        return obj, None
+
+    if not inplace:
+        obj = _copy_container(obj)
+        comment_tokens = obj.ca.items[key]
+    res: list[CommentToken] = []
+    if after:
+        comment_tokens[pos] = inline
+        res.append(after)
+    if trailing:
+        res.extend(_get_comment_list(trailing))
+        comment_tokens[3] = None
+    return obj, res
+
+
+def _push_trailing_comments(
+    obj: Any, comment_tokens: list[CommentToken], inplace: bool
+) -> Any | None:
+    """Attach comments after a nested block (reverse for `_pop_trailing_comments`).
 
-    all_comments: dict[Any, Comments] = {}
+    Returns:
+        Any | None: `obj` (or its copy) with the comments, None if there is
+            no item to attach comments to.
+    """
+    if not _is_container(obj):
+        return None
+    last = _last_item(obj)
+    if last is None or (not inplace and _is_anchored(obj)):
+        return None
+    key, pos = last
+    value = obj[key]
+    if _is_container(value):
+        value = _push_trailing_comments(value, comment_tokens, inplace)
+        if value is None:
+            return None
+        if value is not obj[key]:
+            obj = _copy_container(obj)
+            obj[key] = value
+        return obj
+
+    if not inplace:
+        obj = _copy_container(obj)
+    c = obj.ca.items.setdefault(key, [None, None, None, None])
+    c[pos] = _append_comments(c[pos], comment_tokens)
+    return obj
+
+
+class SortStats:
+    """Statistics of sorting collected by `collect_stats`.
+
+    Attributes:
+        timings (dict[str, float]): seconds spent in phases: "order" (sort keys),
+            "gather" (comments), "rebuild" (container with comments),
+            "check" (`check_sorted`), "load" and "dump" (documents)
+        counts (dict[str, int]): number of "containers", "items" in them,
+            "sorted" containers (with changed order), "comment_tokens"
+            and "dropped" duplicates (`sort_unique`)
+        largest (int): number of items in the largest container
+    """
 
-    # Gather comments
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = defaultdict(float)
+        self.counts: dict[str, int] = defaultdict(int)
+        self.largest = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Add time spent in the block to phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def update(self, other: dict[str, Any]) -> None:
+        """Add statistics from `as_dict` (e.g. from another process)."""
+        for name, value in other["timings"].items():
+            self.timings[name] += value
+        for name, value in other["counts"].items():
+            self.counts[name] += value
+        self.largest = max(self.largest, other["largest"])
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(
+            timings=dict(self.timings),
+            counts=dict(self.counts),
+            largest=self.largest,
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+
+# Statistics to collect, None if disabled
+# (per thread and per asyncio task, see `contextvars`)
+_stats: ContextVar[SortStats | None] = ContextVar("stats", default=None)
+_no_phase = nullcontext()
+
+
+@contextmanager
+def collect_stats() -> Iterator[SortStats]:
+    """Collect statistics of sorting inside the block.
+
+    Without it statistics are not collected at all.
+
+        with collect_stats() as stats:
+            obj = deep_sort(obj)
+        print(stats.to_json())
+    """
+    stats = SortStats()
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+
+def current_stats() -> SortStats | None:
+    """Get statistics being collected (see `collect_stats`) or None."""
+    return _stats.get()
+
+
+def _phase(name: str) -> AbstractContextManager:
+    stats = _stats.get()
+    if stats is None:
+        return _no_phase
+    return stats.phase(name)
+
+
+# New orders of containers, None if disabled
+_orders: ContextVar[dict[int, Sequence[Any]] | None] = ContextVar(
+    "orders", default=None
+)
+
+
+@contextmanager
+def record_orders() -> Iterator[dict[int, Sequence[Any]]]:
+    """Record new order of every container reordered inside the block.
+
+    Keys are `id()` of source containers, values are keys (or indices)
+    in the new order. Containers which keep their order are not recorded.
+
+        with record_orders() as orders:
+            deep_sort(obj, inplace=True)
+    """
+    orders: dict[int, Sequence[Any]] = {}
+    token = _orders.set(orders)
+    try:
+        yield orders
+    finally:
+        _orders.reset(token)
+
+
+# Whether sorting may pause garbage collection (see `pause_gc`)
+_pause_gc: ContextVar[bool] = ContextVar("pause_gc", default=False)
+# Pauses of all threads, the collector is enabled again after the last one
+_gc_lock = threading.Lock()
+_gc_pauses = 0
+_gc_was_enabled = False
+
+
+@contextmanager
+def pause_gc() -> Iterator[None]:
+    """Pause automatic garbage collection while comments are moved inside the block.
+
+    Every item gets a few new objects (tokens, lists), and collections
+    triggered by them scan all objects of the document, so time grows
+    faster than the number of items. The new objects don't have reference
+    cycles, they are collected later as usual.
+
+    The collector is global, so it's paused for all threads of the process
+    while any of them moves comments. It's not paused without this block.
+
+        with pause_gc():
+            obj = deep_sort(obj)
+    """
+    token = _pause_gc.set(True)
+    try:
+        yield
+    finally:
+        _pause_gc.reset(token)
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """Pause garbage collection if allowed (see `pause_gc`)."""
+    global _gc_pauses, _gc_was_enabled
+    if not _pause_gc.get():
+        yield
+        return
+    with _gc_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_was_enabled:
+                gc.enable()
+
+
+def _add_container_stats(obj: CommentedMap | CommentedSeq) -> None:
+    stats = _stats.get()
+    if stats is None:
+        return
+    stats.counts["containers"] += 1
+    stats.counts["items"] += len(obj)
+    stats.largest = max(stats.largest, len(obj))
+
+
+def _add_comment_stats(all_comments: Iterable[Comments]) -> None:
+    stats = _stats.get()
+    if stats is None:
+        return
+    stats.counts["sorted"] += 1
+    stats.counts["comment_tokens"] += sum(
+        len(comments.before or ())
+        + (comments.inline is not None)
+        + len(comments.after or ())
+        for comments in all_comments
+    )
+
+
+def is_sorted(obj: Iterable[Any], /, *, key=None, reverse=False) -> bool:
+    """Check if `sorted` with the same arguments keeps the order unchanged.
+
+    It takes linear time and doesn't touch comments, so it's cheap to call
+    before sorting. For maps keys are checked.
+
+    Args:
+        obj (Iterable[Any]): map, sequence or any other iterable
+        key (Callable | None): key function (as for `sorted`)
+        reverse (bool): check for descending order (as for `sorted`)
+
+    Returns:
+        bool: True if items are already in order
+    """
+    return _first_unsorted(obj, key, reverse) is None
+
+
+def _first_unsorted(
+    obj: Iterable[Any], key, reverse: bool, strict: bool = False
+) -> int | None:
+    """Get position of the first item which is out of order, if any.
+
+    If `strict`, an item equal to the previous one is out of order too.
+    """
+    values = obj if key is None else map(key, obj)
+    current, following = tee(values)
+    next(following, None)
+    # `sorted` is stable, so equal neighbours are in order for both directions
+    if strict:
+        out_of_order = operator.le if reverse else operator.ge
+    else:
+        out_of_order = operator.lt if reverse else operator.gt
+    return next(compress(count(1), map(out_of_order, current, following)), None)
+
+
+def _same_order(source: Collection[Any], target: list[Any]) -> bool:
+    """Check if `target` lists the same keys (or indices) in the same order."""
+    return len(source) == len(target) and all(map(operator.eq, source, target))
+
+
+def _reset_comments(obj: CommentedMap | CommentedSeq) -> None:
+    """Drop comments which are already gathered for sorting in place.
+
+    Only the first comment (`.ca.comment[0]`) is kept at its place.
+    """
+    if obj.ca.comment and obj.ca.comment[0] is not None:
+        obj.ca.comment = [obj.ca.comment[0], None]
+    else:
+        obj.ca.comment = None
+    obj.ca.items.clear()
+    obj.ca.end = []
+
+
+def _gather_comments(
+    obj: CommentedMap | CommentedSeq,
+    sorted_keys: Sequence[Any],
+    inplace: bool,
+    values: dict[Any, Any],
+) -> dict[Any, Comments] | list[Comments | None]:
+    """Gather comments of all items in the way "comments before a block".
+
+    Comments after an element (and after a nested block) are moved to "before"
+    comments of the next element, comments after the last element are moved
+    to the element which will be the last one.
+
+    Args:
+        obj (CommentedMap | CommentedSeq): source object
+        sorted_keys (Sequence[Any]): keys (or indices) in the resulting order
+        inplace (bool): move comments inside nested blocks themselves instead
+            of their copies
+        values (dict[Any, Any]): nested blocks to use instead of the source
+            ones by keys (or indices), copies of nested blocks are added to it
+
+    Returns:
+        dict[Any, Comments] | list[Comments | None]: comments for map keys
+            which have them or comments for every sequence index
+    """
+    all_comments, tail = _gather_item_comments(obj, inplace, values)
+    if sorted_keys and tail:
+        _put_tail_comments(obj, all_comments, values, sorted_keys[-1], tail, inplace)
+    return all_comments
+
+
+def _gather_item_comments(
+    obj: CommentedMap | CommentedSeq, inplace: bool, values: dict[Any, Any]
+) -> tuple[dict[Any, Comments] | list[Comments | None], list[CommentToken] | None]:
+    """Gather comments of all items, see `_gather_comments`.
+
+    Returns:
+        tuple: comments of items and comments after the last item, if any
+    """
+    is_map = isinstance(obj, CommentedMap)
+    inline_pos = 2 if is_map else 0
+    all_comments: dict[Any, Comments] | list[Comments | None]
+    all_comments = {} if is_map else [None] * len(obj)
+    items_comments = obj.ca.items
 
     # First comment is handled specially
-    comments = _get_start_comments(obj.ca.comment)
-    assert comments.after is None
-    prev_after = comments.inline
+    prev_after = _get_start_comments(obj.ca.comment)
     # Next lines' comments
-    for key in obj.keys():
-        comments = _get_map_comments(obj.ca.items.get(key))
+    for item_key, value in _own_items(obj) if is_map else enumerate(obj):
+        comments = _get_item_comments(items_comments.get(item_key), inline_pos)
 
         # add "after" comment from previous element, if any
         if prev_after:
-            if not comments.before:
-                comments.before = []
-            comments.before = prev_after + comments.before
+            if comments is None:
+                comments = Comments(before=prev_after)
+            elif comments.before:
+                comments.before = prev_after + comments.before
+            else:
+                comments.before = prev_after
             prev_after = None
 
-        if not any(
-            [isinstance(obj.get(key), cls) for cls in [CommentedMap, CommentedSeq]]
-        ):
+        if comments is not None and not (is_map and _is_container(value)):
             # consider "after" comment as "before" only
-            # for simple elements
+            # for simple elements (map values)
             prev_after = comments.after
             comments.after = None
-        all_comments[key] = comments
-
-    if sorted_keys and (prev_after or obj.ca.end):
-        last_key = sorted_keys[-1]
-        inline = all_comments[last_key].inline
+        # comments after nested block are "before" for the next element
+        if _is_container(value):
+            value = values.get(item_key, value)
+            block, trailing = _pop_trailing_comments(value, inplace)
+            if block is not value:
+                values[item_key] = block
+            if trailing:
+                prev_after = prev_after + trailing if prev_after else trailing
+        if comments is not None:
+            all_comments[item_key] = comments
+
+    tail = (prev_after or []) + (_get_comment_list(obj.ca.end) or [])
+    return all_comments, tail or None
+
+
+def _put_tail_comments(
+    obj: CommentedMap | CommentedSeq,
+    all_comments: dict[Any, Comments] | list[Comments | None],
+    values: dict[Any, Any],
+    last_key: Any,
+    tail: list[CommentToken],
+    inplace: bool,
+) -> None:
+    """Attach comments after the last item to the item which will be the last one.
+
+    A copy of the nested block is added to `values` (see `_gather_comments`).
+    """
+    value = values.get(last_key, obj[last_key])
+    block = _push_trailing_comments(value, tail, inplace)
+    if block is not None:
+        # Nested block keeps the comments after its last element
+        if block is not value:
+            values[last_key] = block
+    else:
         # Combine inline and after comments
-        if inline:
-            inline[-1].value += "\n"
-            inline += prev_after or []
-            inline += _get_comment_list(obj.ca.end) or []
-        else:
-            inline = prev_after or []
-            inline += _get_comment_list(obj.ca.end) or []
-            inline[0].value = "\n" + inline[0].value
-        all_comments[last_key].inline = inline
+        comments = _item_comments(all_comments, last_key)
+        if comments is None:
+            comments = all_comments[last_key] = Comments()
+        comments.inline = _append_comments(comments.inline, tail)
+
+
+def _item_comments(
+    all_comments: dict[Any, Comments] | list[Comments | None],
+    item_key: Any,
+) -> Comments | None:
+    """Get comments of an item from `_gather_comments` result."""
+    if isinstance(all_comments, list):
+        return all_comments[item_key]
+    return all_comments.get(item_key)
+
+
+def _set_item_comments(
+    obj: CommentedMap | CommentedSeq,
+    item_key: Any,
+    comments: Comments,
+    inline_pos: int,
+    copy: bool,
+) -> None:
+    """Put comments of an item (reverse for `_get_item_comments`).
+
+    If `copy`, lists of comments are copied (tokens are shared), as they may
+    be lists of the source, which must not change with the target.
+    """
+    before, after = comments.before, comments.after
+    if copy:
+        before = list(before) if before else None
+        after = list(after) if after else None
+    c = [None, before, None, after]
+    c[inline_pos] = comments.inline
+    obj.ca.items[item_key] = c
+
+
+def _copy_attributes(
+    obj: CommentedMap | CommentedSeq,
+    target: CommentedMap | CommentedSeq,
+    merged: list[CommentedMap] | None = None,
+) -> None:
+    """Copy flow style, anchor, tag and merge keys (`<<`) to a rebuilt container.
+
+    Maps for merge keys can be replaced with `merged` (e.g. sorted ones).
+    """
+    for attrib in (format_attrib, Anchor.attrib, Tag.attrib):
+        value = getattr(obj, attrib, None)
+        if value is not None:
+            setattr(target, attrib, value)
+    merge = getattr(obj, merge_attrib, None)
+    if merge:
+        if merged is not None:
+            merge = _copy_merge(merge, merged)
+        target.add_yaml_merge(merge)
+
+
+def _copy_merge(merge: MergeValue, merged: list[CommentedMap]) -> MergeValue:
+    """Copy merge keys (`<<`) with other maps."""
+    target = MergeValue()
+    target.extend(merged)
+    target.merge_pos = merge.merge_pos
+    if merge.sequence is not None:
+        # `<<: [*a, *b]` is dumped from the sequence of the same maps
+        sequence = _copy_container(merge.sequence)
+        list.__setitem__(sequence, slice(None), merged)
+        target.set_sequence(sequence)
+    return target
+
+
+def _value(obj: CommentedMap | CommentedSeq, values: dict[Any, Any], key: Any) -> Any:
+    """Value of an item, the copy of a nested block from `values` if any."""
+    return values[key] if key in values else obj[key]
+
+
+def _rebuild(
+    obj: CommentedMap | CommentedSeq,
+    sorted_keys: Sequence[Any],
+    all_comments: dict[Any, Comments] | list[Comments | None],
+    values: dict[Any, Any],
+    inplace: bool,
+) -> CommentedMap | CommentedSeq:
+    """Create another container (or reorder source one) and put comments.
 
-    # Create another map and put comments
-    obj_sorted = CommentedMap()
-    if obj.ca.comment and obj.ca.comment[0] is not None:
-        obj_sorted.ca.comment = [obj.ca.comment[0], None]
-        # obj_sorted.ca.comment = [
-        #     CommentToken(
-        #         value=obj.ca.comment[0],
-        #         start_mark=CommentMark(0),  # reset line
-        #     ),
-        #     None,
-        # ]
-    for key in sorted_keys:
-        obj_sorted[key] = obj[key]
-        comments = all_comments[key]
-        if comments.before:
-            c = obj_sorted.ca.items.setdefault(key, [None, [], None, None])
-            if c[1] is None:
-                c[1] = []
-            c[1].extend(comments.before)
-        if comments.inline:
-            assert type(comments.inline) == list
-            c = obj_sorted.ca.items.setdefault(key, [None, None, None, None])
-            assert c[2] is None
-            c[2] = _merge_comment_tokens(comments.inline)
-        if comments.after:
-            c = obj_sorted.ca.items.setdefault(key, [None, None, None, []])
-            if c[3] is None:
-                c[3] = []
-            c[3].extend(comments.after)
+    Args:
+        obj (CommentedMap | CommentedSeq): source object
+        sorted_keys (Sequence[Any]): keys (or indices) in the resulting order
+        all_comments (dict[Any, Comments] | list[Comments | None]): comments
+            from `_gather_comments`
+        values (dict[Any, Any]): nested blocks from `_gather_comments`, they are
+            empty if `inplace`
+        inplace (bool): reorder `obj` itself instead of building another container
+
+    Returns:
+        CommentedMap | CommentedSeq: target object
+    """
+    is_map = isinstance(obj, CommentedMap)
+    if inplace:
+        obj_sorted = obj
+        if is_map:
+            for key in sorted_keys:
+                obj_sorted.move_to_end(key)
+            # keys which are not in `sorted_keys` are at the beginning now:
+            # dropped ones and keys of merged maps (they go after own keys)
+            rest = list(islice(obj_sorted, len(obj_sorted) - len(sorted_keys)))
+            own = _own_keys(obj_sorted) if rest else ()
+            for key in rest:
+                if key in own:
+                    del obj_sorted[key]
+                else:
+                    obj_sorted.move_to_end(key)
+        else:
+            items = list(obj)
+            list.__setitem__(obj_sorted, slice(None), [items[i] for i in sorted_keys])
+        _reset_comments(obj_sorted)
+    elif is_map:
+        obj_sorted = CommentedMap()
+        for key in sorted_keys:
+            obj_sorted[key] = _value(obj, values, key)
+        if obj.ca.comment and obj.ca.comment[0] is not None:
+            obj_sorted.ca.comment = [obj.ca.comment[0], None]
+        _copy_attributes(obj, obj_sorted)
+    else:
+        items = list(obj)
+        for index, value in values.items():
+            items[index] = value
+        obj_sorted = CommentedSeq([items[i] for i in sorted_keys])
+        _copy_attributes(obj, obj_sorted)
+
+    inline_pos = 2 if is_map else 0
+    for target_key, key in enumerate(sorted_keys):
+        comments = _item_comments(all_comments, key)
+        if comments is not None:
+            if is_map:
+                target_key = key
+            _set_item_comments(
+                obj_sorted, target_key, comments, inline_pos, not inplace
+            )
 
     return obj_sorted
 
 
+def _sort_before(
+    obj: CommentedMap | CommentedSeq,
+    sorted_keys: Sequence[Any] | None,
+    key,
+    reverse: bool,
+    inplace: bool,
+    blocks: dict[Any, Any] | None = None,
+) -> CommentedMap | CommentedSeq:
+    """Sort map or sequence with comments before a block.
+
+    See `map_sort_before` and `seq_sort_before` for details. Unless `inplace`,
+    nested blocks are copied to move comments in them, the source is not changed.
+
+    Args:
+        blocks (dict[Any, Any] | None): sorted nested blocks by keys (or indices)
+            to put instead of the source ones, they are not put if the order
+            is not changed (see `_with_blocks`), only if not `inplace`
+    """
+    _add_container_stats(obj)
+
+    is_map = isinstance(obj, CommentedMap)
+    with _phase("order"):
+        keys = _own_keys(obj) if is_map else _seq_items(obj, blocks)
+        if sorted_keys is None:
+            if is_sorted(keys, key=key, reverse=reverse):
+                return obj
+            if is_map:
+                sorted_keys = sorted(keys, key=key, reverse=reverse)
+            else:
+                # compact indices, no `int` object is kept per item
+                sorted_keys = array("l", sorted_index(keys, key=key, reverse=reverse))
+        elif _same_order(keys if is_map else range(len(obj)), sorted_keys):
+            return obj
+    orders = _orders.get()
+    if orders is not None:
+        orders[id(obj)] = sorted_keys
+
+    with _gc_paused():
+        with _phase("gather"):
+            values = dict(blocks) if blocks else {}
+            all_comments = _gather_comments(obj, sorted_keys, inplace, values)
+        if is_map:
+            _add_comment_stats(all_comments.values())
+        else:
+            _add_comment_stats(filter(None, all_comments))
+
+        with _phase("rebuild"):
+            return _rebuild(obj, sorted_keys, all_comments, values, inplace)
+
+
+def map_sort_before(
+    obj: CommentedMap,
+    sorted_keys: list[Any] | None = None,
+    *,
+    key=None,
+    reverse: bool = False,
+    inplace: bool = False,
+) -> CommentedMap:
+    """Sort map with comments before a block.
+
+    If the order of keys is not changed, `obj` is returned as is.
+
+    Args:
+        obj (CommentedMap): source object
+        sorted_keys (list[Any] | None): list of keys for resulting map,
+            by default keys are sorted with `key` and `reverse`
+        key (Callable | None): key function for map keys (as for `sorted`)
+        reverse (bool): sort in descending order (as for `sorted`)
+        inplace (bool): reorder `obj` itself instead of building another map
+            (flow style, anchor, tag and merge keys are copied to it)
+
+    Returns:
+        CommentedMap: target object
+    """
+    assert isinstance(obj, CommentedMap)
+    return _sort_before(obj, sorted_keys, key, reverse, inplace)
+
+
 def sorted_index(iterable, /, *, key=None, reverse=False) -> list[int]:
     """Wrapper for `sorted` function to return indices.
 
     Mainly uses for `seq_sort_before()` to generate `sorted_indices`.
+    Key function is called once per item.
     """
 
     # source values  [1, 5, 3, 2]
     # source index   [0, 1, 2, 3]
     # result values  [1, 2, 3, 5]
     # result indices [0, 3, 2, 1] <-- this is result
-    return [
-        i[0]
-        for i in sorted(
-            enumerate(iterable),
-            key=lambda x: key(x[1]) if key is not None else x[1],
-            reverse=reverse,
-        )
-    ]
+    values = list(iterable) if key is None else list(map(key, iterable))
+    return sorted(range(len(values)), key=values.__getitem__, reverse=reverse)
+
+
+def seq_sort_before(
+    obj: CommentedSeq,
+    sorted_indices: Sequence[int] | None = None,
+    *,
+    key=None,
+    reverse: bool = False,
+    inplace: bool = False,
+) -> CommentedSeq:
+    """Sort sequence with comments before a block.
 
+    If the order of items is not changed, `obj` is returned as is.
 
-def _get_seq_comments(
-    comment_tokens: list[CommentToken] | None,
-) -> Comments:
-    """Get comments for seq items.
+    Args:
+        obj (CommentedSeq): source object
+        sorted_indices (Sequence[int] | None): indices for resulting list,
+            by default items are sorted with `key` and `reverse`
+        key (Callable | None): key function for items (as for `sorted`)
+        reverse (bool): sort in descending order (as for `sorted`)
+        inplace (bool): reorder `obj` itself instead of building another list
+            (flow style, anchor, tag and merge keys are copied to it)
 
-    Comment for current element is splitted into two: current element and after it.
+    Returns:
+        CommentedSeq: target object
     """
+    assert isinstance(obj, CommentedSeq)
+    return _sort_before(obj, sorted_indices, key, reverse, inplace)
 
-    res = Comments()
-    if comment_tokens is None:
-        return res
 
-    assert len(comment_tokens) == 4
-    assert comment_tokens[0] is not None
-    assert comment_tokens[1] is None
-    assert comment_tokens[2] is None
-    assert comment_tokens[3] is None
-
-    s = _comment_tokens_to_str(comment_tokens[0])
-    # If no inline comment for current element
-    if s is None:
-        return res
-    if "\n" not in s:
-        # no need to split "inline" comment
-        res.inline = _get_comment_list(comment_tokens[2])
-        return res
+# Documents repeat the same keys in many maps, so keys are parsed once
+_KEY_CACHE_SIZE = 2**16
+_DIGITS = re.compile(r"(\d+)")
+# prefix "v", release, pre-release, build
+_VERSION = re.compile(
+    r"[vV]?(\d+(?:\.\d+)*)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]*)?"
+)
 
-    # first line - inline comment
-    # second line and others - for next elements
-    current_after: list[str | None] = s.split("\n", 1)
-    # replace with None if second line is empty
-    if len(current_after) > 1 and current_after[1] == "":
-        current_after[1] = None
-
-    assert type(comment_tokens[0]) == CommentToken
-    if current_after[0]:
-        res.inline = [
-            _copy_comment_token(
-                token=comment_tokens[0],
-                value=current_after[0],
-            )
-        ]
-    if current_after[1]:
-        # start_mark and columns have new indent
-        res.after = [
-            CommentToken(
-                value=current_after[1],
-                start_mark=CommentMark(0),
-                end_mark=comment_tokens[0].end_mark,
-                column=0,
-            )
-        ]
 
-    return res
+@lru_cache(maxsize=_KEY_CACHE_SIZE)
+def _natural_key(text: str) -> tuple:
+    # text and numbers alternate, the text is always the first
+    parts = _DIGITS.split(text)
+    parts[1::2] = map(int, parts[1::2])
+    # the text itself orders keys like "1" and "01"
+    return tuple(parts), text
 
 
-def seq_sort_before(obj: CommentedSeq, sorted_indices: list[Any]) -> CommentedSeq:
-    """Sort sequence with comments before a block.
+def natural_key(value: Any) -> tuple:
+    """Key function to compare numbers in text by value: "node2" < "node10".
+
+        obj_sorted = map_sort_before(obj, key=natural_key)
+    """
+    return _natural_key(str(value))
+
+
+def _prerelease_key(identifier: str) -> tuple:
+    # numeric identifiers go before alphanumeric ones (semantic versioning)
+    if identifier.isdigit():
+        return 0, int(identifier), ""
+    return 1, 0, identifier
+
+
+@lru_cache(maxsize=_KEY_CACHE_SIZE)
+def _version_key(text: str) -> tuple:
+    match = _VERSION.fullmatch(text)
+    if match is None:
+        return 1, _natural_key(text)
+    release = tuple(map(int, match[1].split(".")))
+    if match[2] is None:
+        # release goes after its pre-releases
+        prerelease: tuple = (1,)
+    else:
+        prerelease = (0, tuple(map(_prerelease_key, match[2].split("."))))
+    return 0, release, prerelease, text
+
+
+def version_key(value: Any) -> tuple:
+    """Key function to compare versions: "v1.9.3" < "v1.10.0" < "2.0.0-rc.1" < "2.0.0".
+
+    Versions are dot-separated numbers with optional prefix "v",
+    pre-release ("-rc.1") and build ("+build.5") parts as in semantic versioning.
+    Other values go after versions in natural order (see `natural_key`).
+    """
+    return _version_key(str(value))
+
+
+# Order of values of different types in `sort_seq_by`
+_NUMBER, _STRING, _OTHER = range(3)
+
+
+def _field_key(value: Any) -> tuple:
+    """Key for a field value comparable with keys of values of any type.
+
+    Numbers go before strings, other values (null, maps, sequences, dates)
+    are compared by type name and text.
+    """
+    if isinstance(value, (int, float)):
+        return _NUMBER, value
+    if isinstance(value, str):
+        return _STRING, value
+    return _OTHER, type(value).__name__, str(value)
+
+
+def sort_seq_by(
+    obj: CommentedSeq,
+    fields: Any | list[Any],
+    *,
+    missing: str = "last",
+    reverse: bool = False,
+    inplace: bool = False,
+) -> CommentedSeq:
+    """Sort sequence of maps by values of fields with comments before a block.
+
+    Key of every item is extracted once, items which are not maps have
+    all fields missing. Values of different types don't raise `TypeError`,
+    see `_field_key`.
+
+        obj_sorted = sort_seq_by(obj, ["name", "version"])
 
     Args:
         obj (CommentedSeq): source object
-        sorted_keys (list[Any]): list of indices for resulting list
+        fields (Any | list[Any]): key of a field or list of keys, the first one
+            is compared first
+        missing (str): "first" or "last" - where items without a field go,
+            it doesn't depend on `reverse`
+        reverse (bool): sort in descending order (as for `sorted`)
+        inplace (bool): reorder `obj` itself instead of building another list
 
     Returns:
         CommentedSeq: target object
     """
     assert isinstance(obj, CommentedSeq)
+    if missing not in ("first", "last"):
+        raise ValueError(f"missing must be 'first' or 'last', not {missing!r}")
+    if not isinstance(fields, list):
+        fields = [fields]
+
+    # missing values are the least ones for `first` in ascending order
+    missing_key = (0,) if (missing == "first") != reverse else (2,)
+    absent = object()
+
+    def item_key(item: Any) -> tuple:
+        if not isinstance(item, dict):
+            return (missing_key,) * len(fields)
+        values = (item.get(field, absent) for field in fields)
+        return tuple(
+            missing_key if value is absent else (1, _field_key(value))
+            for value in values
+        )
 
-    all_comments: dict[int, Comments] = {}
+    with _phase("order"):
+        keys = [item_key(item) for item in obj]
+        sorted_indices = sorted_index(keys, reverse=reverse)
+    return seq_sort_before(obj, sorted_indices, inplace=inplace)
 
-    # Gather comments
 
-    # First comment is handled specially
-    comments = _get_start_comments(obj.ca.comment)
-    assert comments.after is None
-    prev_after = comments.inline
-    # Next lines' comments
-    for obj_index in range(len(obj)):
-        comments = _get_seq_comments(obj.ca.items.get(obj_index))
+def _item_column(obj: CommentedMap | CommentedSeq, item_key: Any) -> int:
+    """Column of a key (or a dash) in the source, 0 if unknown."""
+    position = obj.lc.data.get(item_key) if obj.lc.data else None
+    if position is None:
+        return 0
+    # position of a sequence item is position of its value after "- "
+    return position[1] if isinstance(obj, CommentedMap) else max(position[1] - 2, 0)
 
-        # add "after" comment from previous element, if any
-        if prev_after:
-            if not comments.before:
-                comments.before = []
-            comments.before = prev_after + comments.before
 
-        prev_after = comments.after
-        comments.after = None
-        all_comments[obj_index] = comments
+def _comment_line(token: CommentToken, column: int) -> CommentToken:
+    """Make a separate comment line at `column` from an inline comment."""
+    value = token.value.rstrip("\n") + "\n"
+    return CommentToken(value=value, start_mark=CommentMark(column), column=column)
 
-    if sorted_indices and (prev_after or obj.ca.end):
-        last_key = sorted_indices[-1]
-        inline = all_comments[last_key].inline
-        # Combine inline and after comments
-        if inline:
-            inline[-1].value += "\n"
-            inline += prev_after or []
-            inline += _get_comment_list(obj.ca.end) or []
+
+def _merge_dropped_comments(
+    kept: Comments | None, dropped: Comments, column: int
+) -> Comments:
+    """Add comments of a dropped item to "before" comments of the kept one.
+
+    Inline comment of the dropped item becomes a separate line at `column`.
+    """
+    before = list(kept.before or ()) if kept is not None else []
+    before += dropped.before or ()
+    if dropped.inline is not None:
+        before.append(_comment_line(dropped.inline, column))
+    before += dropped.after or ()
+    if kept is None:
+        return Comments(before=before or None)
+    return Comments(before or None, kept.inline, kept.after)
+
+
+def sort_unique(
+    obj: CommentedMap | CommentedSeq,
+    *,
+    key=None,
+    reverse: bool = False,
+    inplace: bool = False,
+) -> CommentedMap | CommentedSeq:
+    """Sort map or sequence and drop items which are equal to previous ones.
+
+    Items are equal if their keys (`key(item)`, for maps `key(map_key)`) are
+    equal, so maps can have duplicates too, e.g. keys in different case.
+    The first item in the source order is kept with its value and comments,
+    comments of dropped items are added to "before" comments of the kept one.
+    Duplicates are found in one pass over the sorted items.
+
+    Exactly equal keys of a map can't be loaded twice: `ruamel.yaml` with
+    `allow_duplicate_keys` keeps the first one and drops the others on load.
+
+    Args:
+        obj (CommentedMap | CommentedSeq): source object
+        key (Callable | None): key function for map keys or items (as for `sorted`)
+        reverse (bool): sort in descending order (as for `sorted`)
+        inplace (bool): reorder `obj` itself instead of building another container
+
+    Returns:
+        CommentedMap | CommentedSeq: target object
+    """
+    assert isinstance(obj, (CommentedMap, CommentedSeq))
+    return _sort_unique(obj, key, reverse, inplace)
+
+
+def _sort_unique(
+    obj: CommentedMap | CommentedSeq,
+    key,
+    reverse: bool,
+    inplace: bool,
+    blocks: dict[Any, Any] | None = None,
+) -> CommentedMap | CommentedSeq:
+    """Sort like `sort_unique`, see `_sort_before` for `blocks`."""
+    is_map = isinstance(obj, CommentedMap)
+    with _phase("order"):
+        source_keys = list(_own_keys(obj)) if is_map else range(len(obj))
+        items = source_keys if is_map else _seq_items(obj, blocks)
+        values = list(items) if key is None else list(map(key, items))
+        # `sorted` is stable, so the first item of a group is the first in the source
+        order = sorted(
+            range(len(source_keys)), key=values.__getitem__, reverse=reverse
+        )
+        kept_positions: list[int] = []
+        dropped: dict[int, list[int]] = {}
+        for position in order:
+            if kept_positions and values[kept_positions[-1]] == values[position]:
+                dropped.setdefault(kept_positions[-1], []).append(position)
+            else:
+                kept_positions.append(position)
+    if not dropped:
+        sorted_keys = [source_keys[i] for i in order]
+        return _sort_before(obj, sorted_keys, None, reverse, inplace, blocks)
+
+    _add_container_stats(obj)
+    stats = _stats.get()
+    if stats is not None:
+        stats.counts["dropped"] += len(source_keys) - len(kept_positions)
+    sorted_keys = [source_keys[i] for i in kept_positions]
+    if not is_map:
+        sorted_keys = array("l", sorted_keys)
+    with _gc_paused():
+        with _phase("gather"):
+            values = dict(blocks) if blocks else {}
+            all_comments = _gather_comments(obj, sorted_keys, inplace, values)
+            for position, positions in dropped.items():
+                kept_key = source_keys[position]
+                comments = _item_comments(all_comments, kept_key)
+                for dropped_key in (source_keys[i] for i in positions):
+                    dropped_comments = _item_comments(all_comments, dropped_key)
+                    if dropped_comments is None:
+                        continue
+                    column = _item_column(obj, dropped_key)
+                    comments = _merge_dropped_comments(
+                        comments, dropped_comments, column
+                    )
+                if comments is not None:
+                    all_comments[kept_key] = comments
+        comments_iter = (_item_comments(all_comments, k) for k in sorted_keys)
+        _add_comment_stats(filter(None, comments_iter))
+
+        with _phase("rebuild"):
+            return _rebuild(obj, sorted_keys, all_comments, values, inplace)
+
+
+def _merge_both_comments(
+    comments_a: Comments | None,
+    comments_b: Comments | None,
+    column: int,
+    moved: set[int],
+) -> Comments | None:
+    """Combine comments of a map key present in both merged maps.
+
+    "Before" comments of `a` go first. If both items have inline comments,
+    the one of `a` becomes a separate line at `column`. Comments between
+    the key and its nested block with ids in `moved` are dropped: they are
+    moved to the first item of the merged block.
+    """
+    before: list[CommentToken] = []
+    inline = None
+    after: list[CommentToken] = []
+    for comments in (comments_a, comments_b):
+        if comments is None:
+            continue
+        before += comments.before or ()
+        if comments.inline is not None:
+            if inline is not None:
+                before.append(_comment_line(inline, column))
+            inline = comments.inline
+        after += (token for token in comments.after or () if id(token) not in moved)
+    if not before and inline is None and not after:
+        return None
+    return Comments(before or None, inline, after or None)
+
+
+def _merge(
+    a: CommentedMap | CommentedSeq, b: CommentedMap | CommentedSeq, key, reverse: bool
+) -> CommentedMap | CommentedSeq:
+    """Merge sorted containers of the same type, see `merge_sorted`."""
+    if (
+        _first_unsorted(a, key, reverse) is not None
+        or _first_unsorted(b, key, reverse) is not None
+    ):
+        raise ValueError("maps and sequences to merge must be sorted")
+    _add_container_stats(a)
+    _add_container_stats(b)
+
+    is_map = isinstance(a, CommentedMap)
+    size_a = len(a)
+    with _phase("order"):
+        if is_map:
+            # keys in both maps go at their places in `a`
+            common = set(a).intersection(b)
+            keys = [*a, *(k for k in b if k not in common)]
+            values = keys if key is None else list(map(key, keys))
         else:
-            inline = prev_after or []
-            inline += _get_comment_list(obj.ca.end) or []
-            inline[0].value = "\n" + inline[0].value
-        all_comments[last_key].inline = inline
-
-    # Create another list and put comments
-    obj_sorted = CommentedSeq()
-    for sorted_index, obj_index in enumerate(sorted_indices):
-        obj_sorted.append(obj[obj_index])
-        comments = all_comments[obj_index]
-        if comments.before:
-            c = obj_sorted.ca.items.setdefault(sorted_index, [None, [], None, None])
-            if c[1] is None:
-                c[1] = []
-            c[1].extend(comments.before)
-        if comments.inline:
-            assert type(comments.inline) == list
-            c = obj_sorted.ca.items.setdefault(sorted_index, [None, None, None, None])
-            assert c[0] is None
-            c[0] = _merge_comment_tokens(comments.inline)
-        assert comments.after is None
+            common = set()
+            keys = [*range(size_a), *range(len(b))]
+            values = [*a, *b] if key is None else [*map(key, a), *map(key, b)]
+        # `sorted` finds two sorted runs and merges them in linear time,
+        # it's stable, so equal items of `a` go first
+        order = sorted(range(len(keys)), key=values.__getitem__, reverse=reverse)
+
+    with _gc_paused():
+        with _phase("gather"):
+            values_a: dict[Any, Any] = {}
+            values_b: dict[Any, Any] = {}
+            comments_a, tail_a = _gather_item_comments(a, False, values_a)
+            comments_b, tail_b = _gather_item_comments(b, False, values_b)
+
+        # nested maps are merged after their trailing comments are gathered
+        merged: dict[Any, Any] = {}
+        moved: dict[Any, set[int]] = {}
+        for k in common:
+            value_a, value_b = _value(a, values_a, k), _value(b, values_b, k)
+            if isinstance(value_a, CommentedMap) and isinstance(value_b, CommentedMap):
+                start_a = _get_start_comments(value_a.ca.comment) or ()
+                start_b = _get_start_comments(value_b.ca.comment) or ()
+                moved[k] = set(map(id, [*start_a, *start_b]))
+                merged[k] = _merge(value_a, value_b, key, reverse)
+
+        with _phase("rebuild"):
+            all_comments: dict[Any, Comments] | list[Comments | None]
+            if is_map:
+                obj_merged = CommentedMap()
+                all_comments = {}
+                for i in order:
+                    k = keys[i]
+                    if k in common:
+                        if k in merged:
+                            obj_merged[k] = merged[k]
+                        else:
+                            obj_merged[k] = _value(b, values_b, k)
+                        comments = _merge_both_comments(
+                            comments_a.get(k),
+                            comments_b.get(k),
+                            _item_column(a, k),
+                            moved.get(k, set()),
+                        )
+                    elif i < size_a:
+                        obj_merged[k] = _value(a, values_a, k)
+                        comments = comments_a.get(k)
+                    else:
+                        obj_merged[k] = _value(b, values_b, k)
+                        comments = comments_b.get(k)
+                    if comments is not None:
+                        all_comments[k] = comments
+            else:
+                values = [
+                    *(_value(a, values_a, i) for i in range(size_a)),
+                    *(_value(b, values_b, i) for i in range(len(b))),
+                ]
+                obj_merged = CommentedSeq([values[i] for i in order])
+                all_comments = [*comments_a, *comments_b]
+                all_comments = [all_comments[i] for i in order]
+
+            tail = (tail_a or []) + (tail_b or [])
+            if tail and obj_merged:
+                last_key = _last_item(obj_merged)[0]
+                blocks: dict[Any, Any] = {}
+                _put_tail_comments(
+                    obj_merged, all_comments, blocks, last_key, tail, False
+                )
+                if blocks:
+                    obj_merged[last_key] = blocks[last_key]
+            inline_pos = 2 if is_map else 0
+            items = all_comments.items() if is_map else enumerate(all_comments)
+            for target_key, comments in items:
+                if comments is not None:
+                    _set_item_comments(
+                        obj_merged, target_key, comments, inline_pos, True
+                    )
+            for source in (a, b):
+                if source.ca.comment and source.ca.comment[0] is not None:
+                    obj_merged.ca.comment = [source.ca.comment[0], None]
+                    break
+        comments_iter = all_comments.values() if is_map else all_comments
+        _add_comment_stats(filter(None, comments_iter))
+
+    return obj_merged
+
+
+def merge_sorted(
+    a: CommentedMap | CommentedSeq,
+    b: CommentedMap | CommentedSeq,
+    *,
+    key=None,
+    reverse: bool = False,
+) -> CommentedMap | CommentedSeq:
+    """Merge two sorted maps (or sequences) into a new sorted one in linear time.
+
+    It's the same as concatenating and sorting, but items are not sorted again.
+    Sequences keep all items, equal items of `a` go first. Keys of maps which
+    are in both maps get the value of `b` (overlay), nested maps are merged
+    recursively. Comments are moved in the same way as by `map_sort_before`,
+    comments of keys in both maps are combined.
+
+        obj = merge_sorted(deep_sort(base), deep_sort(overlay))
 
-    return obj_sorted
+    Args:
+        a (CommentedMap | CommentedSeq): sorted source object
+        b (CommentedMap | CommentedSeq): sorted object of the same type
+        key (Callable | None): key function the sources are sorted with
+        reverse (bool): the sources are sorted in descending order
+
+    Raises:
+        ValueError: if any of merged maps or sequences is not sorted
+
+    Returns:
+        CommentedMap | CommentedSeq: new object, values are not copied
+    """
+    assert isinstance(a, CommentedMap) == isinstance(b, CommentedMap)
+    assert isinstance(a, (CommentedMap, CommentedSeq))
+    assert isinstance(b, (CommentedMap, CommentedSeq))
+    return _merge(a, b, key, reverse)
+
+
+def _drop_moved_comments(
+    obj: CommentedMap, key: Any, start: list[CommentToken] | None
+) -> None:
+    """Forget comments between `key` and its nested block if the block has moved them.
+
+    `ruamel.yaml` keeps such comments both in the item (`.ca.items[key][3]`,
+    they are dumped from there) and in the block (`.ca.comment[1]`).
+    Sorting of the block moves them to its first element.
+    """
+    value = obj[key]
+    comment_tokens = obj.ca.items.get(key)
+    if not start or comment_tokens is None or not comment_tokens[3]:
+        return
+    current = _get_start_comments(value.ca.comment)
+    if (
+        current is not None
+        and len(current) == len(start)
+        and all(map(operator.is_, current, start))
+    ):
+        # the block is not reordered (a copy has other lists of the same tokens)
+        return
+    moved = set(map(id, start))
+    after = [token for token in comment_tokens[3] if id(token) not in moved]
+    comment_tokens[3] = after or None
+
+
+def _priority_order(
+    obj: CommentedMap, priority: list[Any], key, reverse: bool
+) -> list[Any]:
+    """Keys of `obj` with `priority` keys first, the other keys are sorted."""
+    keys = _own_keys(obj)
+    head = [k for k in priority if k in keys]
+    first = set(head)
+    rest = [k for k in keys if k not in first]
+    return head + sorted(rest, key=key, reverse=reverse)
+
+
+def deep_sort(
+    obj: Any,
+    *,
+    map_key=None,
+    seq_key=None,
+    reverse: bool = False,
+    sort_seqs: bool = True,
+    max_depth: int | None = None,
+    order: KeyOrder | dict[str, list[Any]] | None = None,
+    unique: bool = False,
+    inplace: bool = False,
+) -> Any:
+    """Sort maps and sequences at every nesting level with comments before a block.
+
+    Nested containers are sorted first and put to the slot of their parent,
+    then the parent is sorted. So every container is visited only once,
+    containers shared with anchors and aliases too: all aliases get the same
+    sorted container, so they are dumped as aliases again. Only own keys of
+    maps are sorted, maps merged with `<<: *anchor` keep their order and
+    are sorted themselves.
+
+    Args:
+        obj (Any): source object
+        map_key (Callable | None): key function for map keys (as for `sorted`)
+        seq_key (Callable | None): key function for sequence items (as for `sorted`)
+        reverse (bool): sort in descending order (as for `sorted`)
+        sort_seqs (bool): sort sequences too, otherwise only maps are sorted;
+            sequences of items which can't be compared (e.g. maps, see
+            `sort_seq_by`) keep their order
+        max_depth (int | None): the deepest level to sort, `obj` is on level 0
+        order (KeyOrder | dict[str, list[Any]] | None): keys to put first in maps
+            at given paths (see `KeyOrder`), the other keys are sorted as usual
+        unique (bool): drop duplicates of map keys and sequence items
+            (equal with the key functions), see `sort_unique`
+        inplace (bool): reorder containers themselves instead of building new ones,
+            otherwise `obj` is not changed (containers which keep their order
+            and comments are shared with the result)
+
+    Returns:
+        Any: target object (`obj` itself if it isn't a map or a sequence)
+    """
+    if isinstance(order, dict):
+        order = KeyOrder(order)
+    return _deep_sort(
+        obj,
+        {},
+        map_key,
+        seq_key,
+        reverse,
+        sort_seqs,
+        max_depth,
+        order,
+        unique,
+        inplace,
+    )
+
+
+def _deep_sort(
+    obj: Any,
+    memo: dict[int, tuple[Any, Any]],
+    map_key,
+    seq_key,
+    reverse: bool,
+    sort_seqs: bool,
+    max_depth: int | None,
+    order: KeyOrder | None,
+    unique: bool,
+    inplace: bool,
+) -> Any:
+    """Sort like `deep_sort`, `memo` maps ids of visited containers to results.
+
+    Only containers with anchors can be reached through aliases, so only they
+    are kept in `memo` (with their results, so ids are not reused).
+    """
+
+    def walk(node: Any, depth: int, nodes: tuple) -> Any:
+        if max_depth is not None and depth > max_depth:
+            return node
+        if not _is_container(node):
+            return node
+        anchor = getattr(node, Anchor.attrib, None)
+        if anchor is None or anchor.value is None:
+            return sort_node(node, depth, nodes)
+        # aliases get the container sorted where it's met first (the anchor)
+        known = memo.get(id(node))
+        if known is not None:
+            return known[1]
+        # recursive aliases get the source
+        memo[id(node)] = (node, node)
+        result = sort_node(node, depth, nodes)
+        memo[id(node)] = (node, result)
+        memo[id(result)] = (result, result)
+        return result
+
+    def sort_node(node: Any, depth: int, nodes: tuple) -> Any:
+        # sorted nested blocks (new ones unless `inplace`) go to the sorted
+        # container, so the source is not changed
+        blocks: dict[Any, Any] = {}
+        if isinstance(node, CommentedMap):
+            starts: list[tuple[Any, list[CommentToken]]] = []
+            for key, value in _own_items(node):
+                if _is_container(value):
+                    child_nodes = nodes and KeyOrder.descend(nodes, key)
+                    start = _get_start_comments(value.ca.comment)
+                    if start:
+                        starts.append((key, start))
+                    result = walk(value, depth + 1, child_nodes)
+                    if result is not value:
+                        blocks[key] = result
+            merge = getattr(node, merge_attrib, None)
+            if merge:
+                # the order of merged maps matters, only the maps are sorted
+                merged = [walk(value, depth + 1, ()) for value in merge]
+                if any(map(operator.is_not, merged, merge)):
+                    node = _with_blocks(node, blocks, merged)
+                    blocks = {}
+            priority = nodes and KeyOrder.priority(nodes)
+            source = node
+            if unique:
+                node = _sort_unique(node, map_key, reverse, inplace, blocks)
+            if priority:
+                if node is not source:
+                    # the blocks are in the sorted container already
+                    source, blocks = node, {}
+                with _phase("order"):
+                    sorted_keys = _priority_order(node, priority, map_key, reverse)
+                node = _sort_before(node, sorted_keys, None, reverse, inplace, blocks)
+            elif not unique:
+                node = _sort_before(node, None, map_key, reverse, inplace, blocks)
+            if node is source:
+                # the order is not changed
+                node = _with_blocks(node, blocks)
+            if starts and unique:
+                # duplicates with the start comments may be dropped
+                kept = _own_keys(node)
+                starts = [(key, start) for key, start in starts if key in kept]
+            for key, start in starts:
+                _drop_moved_comments(node, key, start)
+            return node
+        if isinstance(node, CommentedSeq):
+            for index, value in enumerate(node):
+                if _is_container(value):
+                    child_nodes = nodes and KeyOrder.descend(nodes, index)
+                    result = walk(value, depth + 1, child_nodes)
+                    if result is not value:
+                        blocks[index] = result
+            if not sort_seqs:
+                return _with_blocks(node, blocks)
+            try:
+                if unique:
+                    result = _sort_unique(node, seq_key, reverse, inplace, blocks)
+                else:
+                    result = _sort_before(node, None, seq_key, reverse, inplace, blocks)
+            except TypeError:
+                # items can't be compared (e.g. maps), they are compared
+                # before anything is changed, so the sequence keeps its order
+                result = node
+            return _with_blocks(node, blocks) if result is node else result
+        return node
+
+    return walk(obj, 0, (order.root,) if order is not None else ())
+
+
+def _match(node: Any, segment: Any) -> Iterable[tuple[Any, Any]]:
+    """Keys (or indices) and values of `node` matching a segment of a path."""
+    if isinstance(node, CommentedMap):
+        # values of merged maps are reached where the maps are defined
+        if segment is WILDCARD:
+            return list(_own_items(node))
+        return [(segment, node[segment])] if segment in _own_keys(node) else []
+    if isinstance(node, CommentedSeq):
+        if segment is WILDCARD:
+            return list(enumerate(node))
+        if isinstance(segment, int) and segment < len(node):
+            return [(segment, node[segment])]
+    return []
+
+
+def _find_items(obj: Any, segments: list[Any]) -> list[tuple[Any, Any]]:
+    """Find parents and keys (or indices) of values at a path (not `$` itself).
+
+    Only containers on the path are visited.
+    """
+    parents = [obj]
+    for segment in segments[:-1]:
+        parents = [
+            value
+            for parent in parents
+            for _, value in _match(parent, segment)
+            if _is_container(value)
+        ]
+    return [
+        (parent, key) for parent in parents for key, _ in _match(parent, segments[-1])
+    ]
+
+
+def sort_at(
+    obj: Any,
+    paths: str | Iterable[str],
+    *,
+    map_key=None,
+    seq_key=None,
+    reverse: bool = False,
+    sort_seqs: bool = True,
+    max_depth: int | None = None,
+    order: KeyOrder | dict[str, list[Any]] | None = None,
+    unique: bool = False,
+    inplace: bool = False,
+) -> Any:
+    """Sort only containers at given paths, the rest of the document is not visited.
+
+    Sorted containers are put back to their parents, comments of the parents
+    (e.g. between a key and its nested block) are kept:
+
+        doc = sort_at(doc, ["$.spec.env", "$.spec.containers[*].ports"])
+
+    Aliases at all `paths` get the same sorted container. Sort with
+    `inplace=True` if containers have aliases outside of `paths`, otherwise
+    those aliases keep the source container.
+
+    Args:
+        obj (Any): source object, it's changed unless the only path is `$`
+        paths (str | Iterable[str]): paths to containers to sort (see `yaml_paths`),
+            paths which don't match anything are ignored
+        map_key, seq_key, reverse, sort_seqs, max_depth, order, unique, inplace:
+            see `deep_sort`, `max_depth` and paths in `order` are relative
+            to the containers at `paths`
+
+    Returns:
+        Any: `obj` with containers at `paths` sorted (sorted `obj` for path `$`)
+
+    Raises:
+        ValueError: if a path is invalid
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    all_segments = [parse_path(expr) for expr in paths]
+    if isinstance(order, dict):
+        order = KeyOrder(order)
+    options = (map_key, seq_key, reverse, sort_seqs, max_depth, order, unique, inplace)
+    # containers shared by several paths (with aliases) are sorted once
+    memo: dict[int, tuple[Any, Any]] = {}
+
+    for segments in all_segments:
+        if not segments:
+            obj = _deep_sort(obj, memo, *options)
+            continue
+        for parent, key in _find_items(obj, segments):
+            value = parent[key]
+            if not _is_container(value):
+                continue
+            start = _get_start_comments(value.ca.comment)
+            parent[key] = _deep_sort(value, memo, *options)
+            if isinstance(parent, CommentedMap):
+                _drop_moved_comments(parent, key, start)
+    return obj
+
+
+def _first_duplicate(obj: Iterable[Any], key) -> int | None:
+    """Get position of the first item equal to one of the previous items, if any."""
+    seen = set()
+    for position, value in enumerate(obj if key is None else map(key, obj)):
+        if value in seen:
+            return position
+        seen.add(value)
+    return None
+
+
+def _first_moved_item(
+    obj: CommentedSeq, key, reverse: bool, unique: bool
+) -> int | None:
+    """Get position of the first item which `deep_sort` would move or drop, if any.
+
+    `deep_sort` keeps the order of items which can't be compared, so an
+    unsorted sequence is only reported if all its items can be sorted.
+    """
+    values = list(obj) if key is None else list(map(key, obj))
+    try:
+        position = _first_unsorted(values, None, reverse, unique)
+    except TypeError:
+        if not unique:
+            # `_sort_before` checks the order the same way before sorting
+            return None
+        # `_sort_unique` sorts anyway, see below
+        position = -1
+    if position is None:
+        return None
+    try:
+        order = sorted(range(len(values)), key=values.__getitem__, reverse=reverse)
+    except TypeError:
+        return None
+    if position >= 0:
+        return position
+    kept = [order[0]] if order else []
+    for index in order[1:]:
+        if values[kept[-1]] != values[index]:
+            kept.append(index)
+    moved = next(compress(count(), map(operator.ne, kept, count())), None)
+    if moved is None and len(kept) < len(values):
+        moved = len(kept)
+    return moved
+
+
+def _line(obj: CommentedMap | CommentedSeq, key: Any) -> int | None:
+    # positions are kept by the loader only
+    position = obj.lc.data.get(key) if obj.lc.data else None
+    return position[0] + 1 if position else None
+
+
+def check_sorted(
+    obj: Any,
+    *,
+    map_key=None,
+    seq_key=None,
+    reverse: bool = False,
+    sort_seqs: bool = True,
+    max_depth: int | None = None,
+    order: KeyOrder | dict[str, list[Any]] | None = None,
+    unique: bool = False,
+) -> list[Unsorted]:
+    """Find maps and sequences which `deep_sort` with the same options would reorder.
+
+    Only the order is checked: comments are not gathered and nothing is
+    rebuilt or changed, so it's much faster than sorting and comparing.
+
+    Args:
+        obj (Any): source object
+        map_key, seq_key, reverse, sort_seqs, max_depth, order, unique:
+            see `deep_sort`, duplicates are reported as out of order
+
+    Returns:
+        list[Unsorted]: unsorted containers from top to bottom
+    """
+    if isinstance(order, dict):
+        order = KeyOrder(order)
+    result: list[Unsorted] = []
+    # containers with aliases are checked once
+    seen: set[int] = set()
+
+    def walk(node: Any, path: list[Any], nodes: tuple) -> None:
+        if max_depth is not None and len(path) > max_depth:
+            return
+        if id(node) in seen:
+            return
+        if isinstance(node, CommentedMap):
+            seen.add(id(node))
+            keys = _own_keys(node)
+            priority = nodes and KeyOrder.priority(nodes)
+            if priority:
+                expected = _priority_order(node, priority, map_key, reverse)
+                differs = map(operator.ne, keys, expected)
+                position = next(compress(count(), differs), None)
+                if position is None and unique:
+                    position = _first_duplicate(keys, map_key)
+            else:
+                position = _first_unsorted(keys, map_key, reverse, unique)
+            if position is not None:
+                key = next(islice(keys, position, None))
+                result.append(Unsorted(format_path(path), key, _line(node, key)))
+            for merged in getattr(node, merge_attrib, None) or ():
+                walk(merged, path + ["<<"], ())
+            items = _own_items(node)
+        elif isinstance(node, CommentedSeq):
+            seen.add(id(node))
+            if sort_seqs:
+                position = _first_moved_item(node, seq_key, reverse, unique)
+                if position is not None:
+                    line = _line(node, position)
+                    result.append(Unsorted(format_path(path), position, line))
+            items = enumerate(node)
+        else:
+            return
+        for key, value in items:
+            if _is_container(value):
+                child_nodes = nodes and KeyOrder.descend(nodes, key)
+                walk(value, path + [key], child_nodes)
+
+    with _phase("check"):
+        walk(obj, [], (order.root,) if order is not None else ())
+    return result
+
+
+# Marker for the end of documents
+_end = object()
+
+
+def sort_all(yaml: ruamel.yaml.YAML, stream: Any, **options) -> Iterator[Any]:
+    """Sort documents of a multi-document stream one by one.
+
+    It's a generator, so only one document is in memory at a time
+    if the result is consumed lazily, e.g. with `yaml.dump_all`:
+
+        yaml.dump_all(sort_all(yaml, source), target)
+
+    Args:
+        yaml (ruamel.yaml.YAML): instance to load documents
+        stream (Any): source for `yaml.load_all` (string, file, path)
+        **options: arguments for `deep_sort`
+
+    Yields:
+        Any: sorted documents
+    """
+    documents = yaml.load_all(stream)
+    while True:
+        with _phase("load"):
+            obj = next(documents, _end)
+        if obj is _end:
+            return
+        yield deep_sort(obj, **options)
+
+
+def check_all(yaml: ruamel.yaml.YAML, stream: Any, **options) -> list[Unsorted]:
+    """Check documents of a multi-document stream with `check_sorted`.
+
+    Args:
+        yaml (ruamel.yaml.YAML): instance to load documents
+        stream (Any): source for `yaml.load_all` (string, file, path)
+        **options: arguments for `check_sorted`
+
+    Returns:
+        list[Unsorted]: unsorted containers of all documents
+    """
+    result = []
+    documents = yaml.load_all(stream)
+    while True:
+        with _phase("load"):
+            obj = next(documents, _end)
+        if obj is _end:
+            return result
+        result += check_sorted(obj, **options)
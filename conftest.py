@@ -2,7 +2,7 @@ import io
 
 import pytest
 import ruamel.yaml
-from comments_sort import map_sort_before, seq_sort_before, sorted_index
+from comments_sort import deep_sort, map_sort_before, seq_sort_before, sorted_index
 
 
 @pytest.fixture(scope="module")
@@ -19,17 +19,25 @@ class Helpers:
         return stream.getvalue()
 
     @staticmethod
-    def sort_map_and_str(yaml, yaml_str, sorted_args={}) -> str:
+    def sort_map_and_str(yaml, yaml_str, sorted_args={}, inplace=False) -> str:
         obj = yaml.load(yaml_str)
         sorted_keys = sorted(obj.keys(), **sorted_args)
-        obj_sorted = map_sort_before(obj, sorted_keys)
+        obj_sorted = map_sort_before(obj, sorted_keys, inplace=inplace)
+        assert obj_sorted is obj or not inplace
         return Helpers.yaml_to_str(yaml, obj_sorted)
 
     @staticmethod
-    def sort_seq_and_str(yaml, yaml_str, sorted_args={}) -> str:
+    def sort_seq_and_str(yaml, yaml_str, sorted_args={}, inplace=False) -> str:
         obj = yaml.load(yaml_str)
         sorted_indices = sorted_index(obj, **sorted_args)
-        obj_sorted = seq_sort_before(obj, sorted_indices)
+        obj_sorted = seq_sort_before(obj, sorted_indices, inplace=inplace)
+        assert obj_sorted is obj or not inplace
+        return Helpers.yaml_to_str(yaml, obj_sorted)
+
+    @staticmethod
+    def deep_sort_and_str(yaml, yaml_str, sorted_args={}) -> str:
+        obj = yaml.load(yaml_str)
+        obj_sorted = deep_sort(obj, **sorted_args)
         return Helpers.yaml_to_str(yaml, obj_sorted)
 
 
@@ -0,0 +1,135 @@
+"""On-disk cache of sorted documents.
+
+Entries are keyed by hash of the source document, sort options and versions
+of `ruamel.yaml` and this library, so the cache is safe to share between runs
+with different options. Files which are already sorted take a marker only.
+"""
+
+import contextlib
+import hashlib
+import os
+import tempfile
+from typing import Any
+
+import comments_sort
+import ruamel.yaml
+
+# Canonical (already sorted) document, the file is empty
+_SAME = ".same"
+# Sorted document
+_SORTED = ".yaml"
+# Every file takes at least one block on disk
+_BLOCK_SIZE = 4096
+
+
+def _option_repr(value: Any) -> str:
+    if callable(value):
+        # functions are identified by name, so it must be unique
+        name = getattr(value, "__qualname__", None)
+        if name is None or "<" in name:
+            raise ValueError(f"can't cache results of unnamed function {value!r}")
+        return f"{getattr(value, '__module__', None)}.{name}"
+    return repr(value)
+
+
+def _library_digest() -> str:
+    """Hash of the library source, it's changed with the library itself.
+
+    All modules which affect sorted documents are hashed: sorting itself,
+    paths of key orders, splicing of minimal diffs and loading and dumping.
+    """
+    import text_splice
+    import yaml_paths
+    import yaml_sort
+
+    digest = hashlib.sha256()
+    for module in (comments_sort, text_splice, yaml_paths, yaml_sort):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class SortCache:
+    """Cache of sorted documents in a directory.
+
+    Args:
+        directory (str): directory for cache files, it's created if needed
+        options (dict[str, Any]): sort options (arguments for `deep_sort`)
+        max_size (int): size of the directory (in bytes) to keep by `prune`
+
+    Raises:
+        ValueError: if a function in `options` has no unique name (lambdas,
+            local functions, partials), results of such functions can't be told
+            apart
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        options: dict[str, Any],
+        max_size: int = 64 * 2**20,
+    ) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        prefix = [ruamel.yaml.__version__, _library_digest()]
+        prefix += [f"{k}={_option_repr(v)}" for k, v in sorted(options.items())]
+        self._prefix = "\n".join(prefix).encode() + b"\0"
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, source: str) -> str:
+        digest = hashlib.sha256(self._prefix + source.encode()).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def get(self, source: str) -> str | None:
+        """Get sorted document for `source` or None if it's not cached."""
+        path = self._path(source)
+        try:
+            if os.path.exists(path + _SAME):
+                os.utime(path + _SAME)
+                return source
+            with open(path + _SORTED, encoding="utf-8") as f:
+                target = f.read()
+            os.utime(path + _SORTED)
+            return target
+        except OSError:
+            return None
+
+    def put(self, source: str, target: str) -> None:
+        """Store sorted document for `source`."""
+        path = self._path(source) + (_SAME if source == target else _SORTED)
+        try:
+            # other processes must not read a partially written file
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                if source != target:
+                    f.write(target)
+            os.replace(tmp_path, path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+    def prune(self) -> None:
+        """Remove least recently used entries to fit into `max_size`."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith((_SAME, _SORTED)):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        # removed by another process
+                        continue
+                    size = max(stat.st_size, _BLOCK_SIZE)
+                    entries.append((stat.st_mtime, size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            total -= size
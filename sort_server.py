@@ -0,0 +1,301 @@
+"""Server to sort YAML files without starting Python for every file.
+
+Editors and git hooks run the tool for a few files at a time, so most of
+the time goes to starting the interpreter and importing `ruamel.yaml`.
+The server keeps them loaded, together with the `YAML` instance and
+compiled options, and sorts documents sent over a unix socket:
+
+    python yaml_sort.py --serve /tmp/yaml-sort.sock
+    python yaml_sort.py --server /tmp/yaml-sort.sock --check *.yaml
+
+Requests and responses are JSON objects, one per line:
+
+    {"id": 1, "op": "sort", "path": "a.yaml", "options": {"key": "natural"}}
+    {"id": 1, "path": "a.yaml", "changed": true, "text": "...", "error": null}
+
+Request fields:
+
+    op: "sort" (default) or "check" (see `yaml_sort.sort_file`)
+    path: path to the file, relative to the directory of the server
+    text: content of the file (e.g. unsaved buffer), the file isn't read then
+    stats: add statistics of sorting (`SortStats.as_dict()`) to the response
+    options: "key" (name from `yaml_sort.KEYS`), "reverse", "sort_seqs",
+        "max_depth", "unique", "minimal_diff", "order" (map of paths to lists
+        of keys) or "order_file" (path to YAML file with such a map)
+    id: any value, it's returned as is
+
+Response fields: "id", "path", "changed", "error" (message or null),
+"text" (sorted documents, for "sort"), "unsorted" (list of objects with
+"path", "key" and "line", for "check") and "stats".
+
+Requests are handled one at a time by a single worker thread, which owns
+the `YAML` instance (see `yaml_sort._get_yaml`), connections are served
+concurrently.
+"""
+
+import json
+import os
+import socket
+import stat
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
+
+from yaml_sort import KEYS, key_function, load_order, parse_order, sort_file
+
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Executor
+
+# The longest request line, requests contain whole documents
+LINE_LIMIT = 2**26
+
+_OPTIONS = {
+    "key",
+    "reverse",
+    "sort_seqs",
+    "max_depth",
+    "unique",
+    "minimal_diff",
+    "order",
+    "order_file",
+}
+
+
+@lru_cache(maxsize=64)
+def _compile_options(
+    spec: str, order_mtime: float | None
+) -> tuple[dict[str, Any], bool]:
+    """Arguments for `sort_file` from options of a request (as JSON).
+
+    Results are cached, so key order isn't loaded and compiled for every
+    request. `order_mtime` is a part of the cache key to reload changed files.
+
+    Returns:
+        tuple[dict[str, Any], bool]: arguments for `deep_sort` and `minimal_diff`
+
+    Raises:
+        ValueError: if options are invalid
+    """
+    raw = json.loads(spec)
+    unknown = raw.keys() - _OPTIONS
+    if unknown:
+        raise ValueError(f"unknown options: {', '.join(sorted(unknown))}")
+    name = raw.get("key", "plain")
+    if name not in KEYS:
+        raise ValueError(f"unknown key {name!r}, expected one of {', '.join(KEYS)}")
+    max_depth = raw.get("max_depth")
+    if max_depth is not None and not isinstance(max_depth, int):
+        raise ValueError("max_depth must be an integer")
+
+    key = key_function(name)
+    options = dict(
+        map_key=key,
+        seq_key=key,
+        reverse=bool(raw.get("reverse", False)),
+        sort_seqs=bool(raw.get("sort_seqs", False)),
+        max_depth=max_depth,
+        unique=bool(raw.get("unique", False)),
+    )
+    if raw.get("order") is not None:
+        options["order"] = parse_order(raw["order"])
+    elif raw.get("order_file") is not None:
+        options["order"] = load_order(raw["order_file"])
+    return options, bool(raw.get("minimal_diff", False))
+
+
+def handle_request(request: Any) -> dict[str, Any]:
+    """Handle a request (see the module description) and make the response.
+
+    Errors are reported in the response, the function doesn't raise.
+    """
+    import ruamel.yaml
+
+    if not isinstance(request, dict):
+        return {"id": None, "path": None, "changed": False, "error": "not an object"}
+    response = {"id": request.get("id"), "path": request.get("path")}
+    op = request.get("op", "sort")
+    path = request.get("path")
+    text = request.get("text")
+    raw = request.get("options") or {}
+    try:
+        if op not in ("sort", "check"):
+            raise ValueError(f"unknown op {op!r}")
+        if path is None and text is None:
+            raise ValueError("path or text is required")
+        if not isinstance(raw, dict):
+            raise ValueError("options must be an object")
+        order_file = raw.get("order_file")
+        order_mtime = os.stat(order_file).st_mtime if order_file else None
+        options, minimal_diff = _compile_options(
+            json.dumps(raw, sort_keys=True), order_mtime
+        )
+    except (OSError, ruamel.yaml.YAMLError, TypeError, ValueError) as e:
+        response.update(changed=False, error=str(e))
+        return response
+
+    try:
+        result = sort_file(
+            path if path is not None else "<text>",
+            stats=bool(request.get("stats")),
+            check=op == "check",
+            minimal_diff=minimal_diff,
+            source=text,
+            **options,
+        )
+    except Exception as e:
+        # e.g. `RecursionError` for deeply nested documents, the server goes on
+        response.update(changed=False, error=str(e) or type(e).__name__)
+        return response
+    response.update(changed=result.changed, error=result.error)
+    if result.error is None and op == "check":
+        response["unsorted"] = [
+            dict(path=unsorted.path, key=unsorted.key, line=unsorted.line)
+            for unsorted in result.unsorted
+        ]
+    elif result.error is None:
+        response["text"] = result.target
+    if result.stats is not None:
+        response["stats"] = result.stats
+    return response
+
+
+def _encode(response: dict[str, Any]) -> bytes:
+    # keys of unsorted containers may be of any type (dates, tuples, ...)
+    return json.dumps(response, default=str).encode("utf-8") + b"\n"
+
+
+async def _serve_connection(
+    reader: "asyncio.StreamReader",
+    writer: "asyncio.StreamWriter",
+    executor: "Executor",
+) -> None:
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # the rest of the line can't be skipped reliably
+                writer.write(_encode({"id": None, "error": "request is too long"}))
+                break
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"id": None, "error": f"invalid JSON: {e}"}
+            else:
+                response = await loop.run_in_executor(
+                    executor, handle_request, request
+                )
+            writer.write(_encode(response))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Remove socket file left by a server which wasn't stopped properly.
+
+    Raises:
+        OSError: if the file isn't a socket or a server is listening on it
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise OSError(f"server is already running on {path}")
+
+
+async def run_server(path: str) -> None:
+    """Serve requests on unix socket `path` until SIGINT or SIGTERM.
+
+    Raises:
+        OSError: if the socket can't be created
+    """
+    import asyncio
+    import signal
+    from concurrent.futures import ThreadPoolExecutor
+    from functools import partial
+
+    _remove_stale_socket(path)
+    loop = asyncio.get_running_loop()
+    # the only thread using the `YAML` instance of the process
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yaml-sort")
+    try:
+        # import and create everything before the first request
+        await loop.run_in_executor(executor, handle_request, {"text": "b: 1\na: 1\n"})
+        server = await asyncio.start_unix_server(
+            partial(_serve_connection, executor=executor), path, limit=LINE_LIMIT
+        )
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        async with server:
+            await stop.wait()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def serve(path: str) -> None:
+    """Run the server (see `run_server`) in a new event loop."""
+    import asyncio
+
+    asyncio.run(run_server(path))
+
+
+class Client:
+    """Connection to the server, requests are sent one by one:
+
+        with Client("/tmp/yaml-sort.sock") as client:
+            response = client.request({"path": "a.yaml", "op": "check"})
+
+    Raises:
+        OSError: if the server isn't running
+    """
+
+    def __init__(self, path: str):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(path)
+        except OSError:
+            self._sock.close()
+            raise
+        self._file = self._sock.makefile("rwb")
+
+    def request(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Send the request and wait for the response.
+
+        Raises:
+            ConnectionError: if the server closed the connection
+        """
+        self._file.write(json.dumps(request).encode("utf-8") + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        return json.loads(line)
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,96 @@
+import asyncio
+import multiprocessing
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import async_sort
+import pytest
+import ruamel.yaml
+from async_sort import sort_stream
+
+UNSORTED = "b: two # 2\n# 1\na: one\n"
+SORTED = "# 1\na: one\nb: two # 2\n"
+
+
+async def _sort_bytes(data: bytes, **kwargs) -> bytes:
+    """Sort `data` with streams of a socket pair as a stand-in for connections."""
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    source, target = socket.socketpair()
+    _, writer = await asyncio.open_connection(sock=source)
+    result_reader, _ = await asyncio.open_connection(sock=target)
+    try:
+        await sort_stream(reader, writer, **kwargs)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return await result_reader.read()
+
+
+def _process_pool(max_workers: int) -> ProcessPoolExecutor:
+    # forked workers would keep copies of open sockets
+    context = multiprocessing.get_context("forkserver")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+@pytest.mark.parametrize("executor_type", [None, ThreadPoolExecutor, _process_pool])
+def test_sort_stream(executor_type):
+    executor = executor_type(max_workers=2) if executor_type else None
+    try:
+        data = b"- b\n- a\n---\n" + UNSORTED.encode()
+        result = asyncio.run(_sort_bytes(data, executor=executor, sort_seqs=True))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    assert result.decode() == "- a\n- b\n---\n" + SORTED
+
+
+def test_sort_stream_limit(monkeypatch):
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+    sort_text = async_sort._sort_text
+
+    def counting_sort_text(*args):
+        nonlocal active, max_active
+        with lock:
+            active += 1
+            max_active = max(max_active, active)
+        time.sleep(0.01)
+        try:
+            return sort_text(*args)
+        finally:
+            with lock:
+                active -= 1
+
+    monkeypatch.setattr(async_sort, "_sort_text", counting_sort_text)
+
+    async def sort_all():
+        limit = asyncio.Semaphore(3)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            return await asyncio.gather(
+                *(
+                    _sort_bytes(
+                        f"b: {i}\na: {i}\n".encode(), executor=executor, limit=limit
+                    )
+                    for i in range(20)
+                )
+            )
+
+    results = asyncio.run(sort_all())
+    assert [r.decode() for r in results] == [f"a: {i}\nb: {i}\n" for i in range(20)]
+    assert 1 < max_active <= 3
+
+
+def test_sort_stream_errors():
+    with pytest.raises(ValueError):
+        asyncio.run(_sort_bytes(UNSORTED.encode(), max_size=10))
+    with pytest.raises(ruamel.yaml.YAMLError):
+        asyncio.run(_sort_bytes(b"a: [\n"))
+    # the instance of the thread is replaced after an error
+    assert asyncio.run(_sort_bytes(UNSORTED.encode(), minimal_diff=True)) == (
+        SORTED.encode()
+    )
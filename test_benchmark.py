@@ -0,0 +1,56 @@
+import pytest
+from benchmark import (
+    PHASES,
+    SHAPES,
+    main,
+    measure_startup,
+    run,
+    run_scaling,
+    synthetic_seq,
+)
+from comments_sort import seq_sort_before
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_run(shape):
+    result = run(shape, 20, repeat=1)
+    for phase in PHASES:
+        assert result[f"{phase}_time"] > 0
+        assert result[f"{phase}_memory"] > 0
+
+
+def test_run_scaling():
+    result = run_scaling(20, repeat=1)
+    assert result["size"] == 20
+    assert result["sort_time"] > 0
+
+
+def test_synthetic_seq(prepare_yaml, helpers):
+    obj = seq_sort_before(synthetic_seq(3))
+    assert obj == ["item 0000000", "item 0000001", "item 0000002"]
+    assert helpers.yaml_to_str(prepare_yaml, obj) == (
+        "# comment before\n"
+        "- item 0000000  # inline 0\n"
+        "# comment before\n"
+        "- item 0000001  # inline 1\n"
+        "# comment before\n"
+        "- item 0000002  # inline 2\n"
+    )
+
+
+def test_measure_startup(tmp_path):
+    result = measure_startup(["--help"], repeat=1)
+    assert result["time"] > 0
+    assert 0 < result["baseline_time"] < result["time"]
+    assert "argparse" in result["modules"]
+    assert "ruamel.yaml" not in result["modules"]
+
+    (tmp_path / "a.yaml").write_text("a: 1\n")
+    result = measure_startup([str(tmp_path / "a.yaml")], repeat=1)
+    assert "ruamel.yaml" in result["modules"]
+
+
+def test_import_budget(capsys):
+    assert main(["--startup", "--repeat", "1", "--import-budget", "100"]) == 0
+    assert main(["--startup", "--repeat", "1", "--import-budget", "0"]) == 1
+    assert "no-files: over budget" in capsys.readouterr().out
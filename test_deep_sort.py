@@ -0,0 +1,696 @@
+import gc
+import io
+import itertools
+import json
+import threading
+
+import pytest
+from comments_sort import (
+    Unsorted,
+    _gc_paused,
+    check_sorted,
+    collect_stats,
+    current_stats,
+    deep_sort,
+    pause_gc,
+    sort_all,
+    sort_at,
+)
+
+
+@pytest.mark.parametrize(
+    "yaml_raw, yaml_sorted, sorted_args",
+    [
+        (
+            # nested maps
+            """\
+line 3: three
+line 2:
+  line 2.2: two-two
+  line 2.1: two-one
+line 1: one
+""",
+            """\
+line 1: one
+line 2:
+  line 2.1: two-one
+  line 2.2: two-two
+line 3: three
+""",
+            {},
+        ),
+        (
+            # nested seq values
+            """\
+b:
+- line 2
+- line 1 # 1.1
+a:
+- line 4
+# 3.1
+- line 3
+""",
+            """\
+a:
+# 3.1
+- line 3
+- line 4
+b:
+- line 1 # 1.1
+- line 2
+""",
+            {},
+        ),
+        (
+            # comments after nested values
+            """\
+line 3: three
+line 2:
+  line 2.2: two-two # 2.2
+  line 2.1: two-one
+# 1.1
+line 1: one
+# last
+""",
+            """\
+# 1.1
+line 1: one
+line 2:
+  line 2.1: two-one
+  line 2.2: two-two # 2.2
+line 3: three
+# last
+""",
+            {},
+        ),
+        (
+            # "last" comment after nested values
+            """\
+line 3:
+  line 3.2: three-two
+  line 3.1: three-one
+line 1: one
+# last
+""",
+            """\
+line 1: one
+line 3:
+  line 3.1: three-one
+  line 3.2: three-two
+# last
+""",
+            {},
+        ),
+        (
+            # comments after nested seq values
+            """\
+- line 3
+- - line 2.2 # 2.2
+  - line 2.1
+# 1.1
+- line 1
+""",
+            """\
+- - line 2.1
+  - line 2.2 # 2.2
+# 1.1
+- line 1
+- line 3
+""",
+            dict(seq_key=str),
+        ),
+        (
+            # seq of maps
+            """\
+- name: b
+  value: 2
+- value: 1
+  name: a
+""",
+            """\
+- name: a
+  value: 1
+- name: b
+  value: 2
+""",
+            dict(seq_key=lambda x: x["name"]),
+        ),
+        (
+            # maps only
+            """\
+b:
+- line 2
+- line 1
+a: one
+""",
+            """\
+a: one
+b:
+- line 2
+- line 1
+""",
+            dict(sort_seqs=False),
+        ),
+        (
+            # key function for map keys
+            """\
+B: one
+a: two
+""",
+            """\
+a: two
+B: one
+""",
+            dict(map_key=str.lower),
+        ),
+        (
+            # max depth
+            """\
+line 2:
+  line 2.2: two-two
+  line 2.1: two-one
+line 1: one
+""",
+            """\
+line 1: one
+line 2:
+  line 2.2: two-two
+  line 2.1: two-one
+""",
+            dict(max_depth=0),
+        ),
+        (
+            # flow style and anchors are kept
+            """\
+c: {y: 1, x: 2}
+b: &b [3, 1]
+a: *b
+""",
+            """\
+a: &b [1, 3]
+b: *b
+c: {x: 2, y: 1}
+""",
+            dict(inplace=True),
+        ),
+        (
+            # keys to put first for paths
+            """\
+spec:
+  containers:
+  # web
+  - image: nginx
+    args:
+    - b
+    - a
+    name: web
+kind: Pod
+apiVersion: v1
+""",
+            """\
+apiVersion: v1
+kind: Pod
+spec:
+  containers:
+  # web
+  - name: web
+    image: nginx
+    args:
+    - a
+    - b
+""",
+            dict(
+                order={
+                    "$": ["apiVersion", "kind", "metadata", "spec"],
+                    "$.spec.containers[*]": ["name", "image"],
+                }
+            ),
+        ),
+        (
+            # key is preferred to wildcard, the rest is sorted with options
+            """\
+b:
+  B: 1
+  a: 2
+  c: 3
+a:
+  B: 1
+  a: 2
+  c: 3
+""",
+            """\
+b:
+  c: 3
+  B: 1
+  a: 2
+a:
+  B: 1
+  c: 3
+  a: 2
+""",
+            dict(
+                order={"$.*": ["c"], "$.a": ["B"]},
+                map_key=str.lower,
+                reverse=True,
+            ),
+        ),
+        (
+            # comment between a key and its nested block is not duplicated
+            """\
+b:
+  # about y
+  y: 1
+  x: 2
+a: 0
+""",
+            """\
+a: 0
+b:
+  x: 2
+  # about y
+  y: 1
+""",
+            {},
+        ),
+        (
+            # duplicates are dropped after nested containers are sorted
+            """\
+hosts:
+- b
+- a # a
+- b
+Hosts: [c]
+""",
+            """\
+hosts:
+- a # a
+- b
+""",
+            dict(unique=True, map_key=str.lower),
+        ),
+        (
+            """\
+hosts:
+- b
+- a # a
+- [y, x]
+- b
+- [x, y]
+""",
+            """\
+hosts:
+- [x, y]
+- a # a
+- b
+""",
+            dict(unique=True, seq_key=str),
+        ),
+        (
+            # maps can't be compared, sequences of them keep their order
+            """\
+spec:
+  containers:
+  - name: b
+    image: x
+  - name: a
+  - [2, 1]
+  tags: [b, a]
+""",
+            """\
+spec:
+  containers:
+  - image: x
+    name: b
+  - name: a
+  - [1, 2]
+  tags: [a, b]
+""",
+            {},
+        ),
+        (
+            "- {b: 1}\n- {a: 1}\n- {b: 1}\n",
+            "- {b: 1}\n- {a: 1}\n- {b: 1}\n",
+            dict(unique=True),
+        ),
+        (
+            # the dropped duplicate has comments before its nested block
+            "B: 1\nb:\n  # first\n  y: 2\n  x: 1\na:\n  # a\n  d: 1\n  c: 2\n",
+            "a:\n  c: 2\n  # a\n  d: 1\n  # first\nB: 1\n",
+            dict(unique=True, map_key=str.lower),
+        ),
+        (
+            "B: 1\nb:\n  # first\n  y: 2\n  x: 1\n",
+            "  # first\nB: 1\n",
+            dict(unique=True, map_key=str.lower, inplace=True),
+        ),
+    ],
+)
+def test_deep_sort(prepare_yaml, helpers, yaml_raw, yaml_sorted, sorted_args):
+    assert helpers.deep_sort_and_str(prepare_yaml, yaml_raw, sorted_args) == yaml_sorted
+
+
+@pytest.mark.parametrize(
+    "yaml_raw, check_args, result",
+    [
+        ("a: 1\nb: [2, 1]\n", {}, [Unsorted("$.b", 1, 2)]),
+        ("a: 1\nb: [2, 1]\n", dict(sort_seqs=False), []),
+        ("- name: b\n- name: a\n", {}, []),
+        ("- {b: 1}\n- {b: 1}\n", dict(unique=True), []),
+        (
+            "b:\n  y: 1\n  x: 1\na:\n- {d: 1, c: 1}\n",
+            {},
+            [
+                Unsorted("$", "a", 4),
+                Unsorted("$.b", "x", 3),
+                Unsorted("$.a[0]", "c", 5),
+            ],
+        ),
+        ("b:\n  y: 1\n  x: 1\na: 1\n", dict(max_depth=0), [Unsorted("$", "a", 4)]),
+        ("a: 1\nB: 1\n", dict(map_key=str.lower), []),
+        ("a: 1\nb: 1\n", dict(reverse=True), [Unsorted("$", "b", 2)]),
+        (
+            "name: x\nb: 1\nversion: 1\n",
+            dict(order={"$": ["name", "version"]}),
+            [Unsorted("$", "b", 2)],
+        ),
+        ("name: x\nversion: 1\na: 1\n", dict(order={"$": ["name", "version"]}), []),
+        ("- a\n- a\n", dict(unique=True), [Unsorted("$", 1, 2)]),
+        (
+            "a: 1\nB: 1\nb: 1\n",
+            dict(unique=True, map_key=str.lower),
+            [Unsorted("$", "b", 3)],
+        ),
+        (
+            "name: x\nb: 1\nB: 1\n",
+            dict(unique=True, map_key=str.lower, order={"$": ["name"]}),
+            [Unsorted("$", "B", 3)],
+        ),
+    ],
+)
+def test_check_sorted(prepare_yaml, yaml_raw, check_args, result):
+    obj = prepare_yaml.load(yaml_raw)
+    assert check_sorted(obj, **check_args) == result
+    assert check_sorted(deep_sort(obj, **check_args), **check_args) == []
+
+
+@pytest.mark.parametrize(
+    "check_args", [{}, dict(unique=True), dict(reverse=True, unique=True)]
+)
+def test_check_sorted_same_as_deep_sort(prepare_yaml, helpers, check_args):
+    # sequences with items which can't be compared keep their order
+    items = ["b", "a", "B", "1", "{x: 1}"]
+    raws = ["[b, a, {x: 1}]", "[c, a, B, 1]"] + [
+        f"[{', '.join(combo)}]" for combo in itertools.product(items, repeat=3)
+    ]
+    for raw in raws:
+        source = helpers.yaml_to_str(prepare_yaml, prepare_yaml.load(raw))
+        obj_sorted = deep_sort(prepare_yaml.load(raw), **check_args)
+        unchanged = helpers.yaml_to_str(prepare_yaml, obj_sorted) == source
+        assert (check_sorted(prepare_yaml.load(raw), **check_args) == []) is unchanged
+
+
+def test_sort_all(prepare_yaml, helpers):
+    yaml_raw = """\
+b: two
+a: one # 1
+---
+- line 2
+# 1.1
+- line 1
+"""
+    yaml_sorted = """\
+a: one # 1
+b: two
+---
+# 1.1
+- line 1
+- line 2
+"""
+    documents = sort_all(prepare_yaml, yaml_raw)
+    assert helpers.yaml_to_str(prepare_yaml, next(documents)) == "a: one # 1\nb: two\n"
+    documents.close()
+
+    stream = io.StringIO()
+    prepare_yaml.dump_all(sort_all(prepare_yaml, yaml_raw), stream)
+    assert stream.getvalue() == yaml_sorted
+
+
+ANCHORS_RAW = """\
+base: &base
+  z: 1
+  a: [3, 2]
+flow: {d: 1, c: 2}
+job:
+  y: 1
+  <<: *base
+  b: 3 # b
+multi:
+  <<: [*base, {q: 1, p: 2}]
+  x: 1
+other: *base
+"""
+ANCHORS_SORTED = """\
+base: &base
+  a: [2, 3]
+  z: 1
+flow: {c: 2, d: 1}
+job:
+  b: 3 # b
+  <<: *base
+  y: 1
+multi:
+  <<: [*base, {p: 2, q: 1}]
+  x: 1
+other: *base
+"""
+
+
+@pytest.mark.parametrize("inplace", [False, True])
+def test_deep_sort_anchors(prepare_yaml, helpers, inplace):
+    # aliases are not expanded, merged keys are not sorted as own keys
+    obj = prepare_yaml.load(ANCHORS_RAW)
+    with collect_stats() as stats:
+        obj_sorted = deep_sort(obj, inplace=inplace)
+    assert helpers.yaml_to_str(prepare_yaml, obj_sorted) == ANCHORS_SORTED
+    assert obj_sorted["other"] is obj_sorted["base"]
+    assert obj_sorted["job"]["a"] is obj_sorted["base"]["a"]
+    assert obj_sorted["multi"]["p"] == 2
+    # every shared container is sorted once
+    assert stats.counts["containers"] == 7
+
+
+def test_check_sorted_anchors(prepare_yaml):
+    obj = prepare_yaml.load(ANCHORS_RAW)
+    assert check_sorted(obj) == [
+        Unsorted("$.base", "a", 3),
+        Unsorted("$.base.a", 1, 3),
+        Unsorted("$.flow", "c", 4),
+        Unsorted("$.job", "b", 8),
+        Unsorted("$.multi.<<", "p", 10),
+    ]
+    assert check_sorted(deep_sort(obj)) == []
+
+
+SORT_AT_RAW = """\
+b: 1
+spec: # spec
+  # env
+  env:
+    # first
+    z: 1
+    a: 2 # two
+  items:
+  - ports: [3, 1]
+    name: y
+  - name: x
+a: 1
+"""
+
+
+@pytest.mark.parametrize(
+    "paths, yaml_sorted, sort_args",
+    [
+        (
+            # the rest of the document isn't changed
+            "$.spec.env",
+            """\
+b: 1
+spec: # spec
+  # env
+  env:
+    a: 2 # two
+    # first
+    z: 1
+  items:
+  - ports: [3, 1]
+    name: y
+  - name: x
+a: 1
+""",
+            {},
+        ),
+        (
+            # wildcards, several paths
+            ["$.spec.items[*]", "$.spec.items[0].ports"],
+            """\
+b: 1
+spec: # spec
+  # env
+  env:
+    # first
+    z: 1
+    a: 2 # two
+  items:
+  - name: y
+    ports: [1, 3]
+  - name: x
+a: 1
+""",
+            {},
+        ),
+        (
+            # options are relative to the container
+            "$.spec",
+            """\
+b: 1
+spec: # spec
+  # env
+  items:
+  - ports: [3, 1]
+    name: y
+  - name: x
+  env:
+    # first
+    z: 1
+    a: 2 # two
+a: 1
+""",
+            dict(order={"$": ["items"]}, max_depth=0),
+        ),
+        (
+            # paths which don't match anything and scalars are ignored
+            ["$.b", "$.missing.x", "$.spec.items[5]", "$[0]"],
+            SORT_AT_RAW,
+            {},
+        ),
+        (
+            "$",
+            """\
+a: 1
+b: 1
+spec: # spec
+  # env
+  items:
+  - name: y
+    ports: [3, 1]
+  - name: x
+  env:
+    a: 2 # two
+    # first
+    z: 1
+""",
+            dict(sort_seqs=False, order={"$.spec": ["items"]}),
+        ),
+    ],
+)
+def test_sort_at(prepare_yaml, helpers, paths, yaml_sorted, sort_args):
+    obj = prepare_yaml.load(SORT_AT_RAW)
+    obj_sorted = sort_at(obj, paths, **sort_args)
+    assert helpers.yaml_to_str(prepare_yaml, obj_sorted) == yaml_sorted
+
+
+def test_sort_at_invalid(prepare_yaml, helpers):
+    obj = prepare_yaml.load(SORT_AT_RAW)
+    with pytest.raises(ValueError):
+        sort_at(obj, ["$.spec", "spec.env"])
+    # paths are checked before sorting
+    assert helpers.yaml_to_str(prepare_yaml, obj) == SORT_AT_RAW
+
+
+@pytest.mark.parametrize("inplace", [False, True])
+def test_sort_at_aliases(prepare_yaml, helpers, inplace):
+    obj = prepare_yaml.load("x: &x\n  b: 1\n  a: 2\ny: [*x, *x]\n")
+    obj_sorted = sort_at(obj, ["$.y[*]", "$.x"], inplace=inplace)
+    assert obj_sorted["y"][0] is obj_sorted["y"][1] is obj_sorted["x"]
+    assert helpers.yaml_to_str(prepare_yaml, obj_sorted) == (
+        "x: &x\n  a: 2\n  b: 1\ny: [*x, *x]\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "yaml_raw, sort_args",
+    [
+        ("z: 1\nb:\n  y: 1\n  x: 2\n# before a\na: 1\n", {}),
+        ("- - y\n  - x # x\n  # before a\n- a\n# end\n", {}),
+        ("b:\n  # about y\n  y: 1\n  x: 2\na: 0\n", {}),
+        (
+            "b: [y, x, y]\nB:\n  c: 1 # c\n  # before d\n  d: 2\na: 1\n",
+            dict(unique=True, map_key=str.lower),
+        ),
+        (ANCHORS_RAW, {}),
+        (SORT_AT_RAW, dict(order={"$.spec": ["items"]})),
+    ],
+)
+def test_deep_sort_source_unchanged(prepare_yaml, helpers, yaml_raw, sort_args):
+    obj = prepare_yaml.load(yaml_raw)
+    deep_sort(obj, **sort_args)
+    source = helpers.yaml_to_str(prepare_yaml, prepare_yaml.load(yaml_raw))
+    assert helpers.yaml_to_str(prepare_yaml, obj) == source
+
+
+def test_deep_sort_result_comments_edited(prepare_yaml, helpers):
+    # nested blocks are copied with their own lists of comments
+    yaml_raw = "z:\n  # in\n  d: 1 # d\n  # c\n  c: 2\n# after\ny:\n- 2 # 2\n- 1\n"
+    obj = prepare_yaml.load(yaml_raw)
+    obj_sorted = deep_sort(obj, sort_seqs=True)
+    for block in (obj_sorted, obj_sorted["z"]):
+        for key in block:
+            block.yaml_set_comment_before_after_key(key, before="x", after="y")
+    source = helpers.yaml_to_str(prepare_yaml, prepare_yaml.load(yaml_raw))
+    assert helpers.yaml_to_str(prepare_yaml, obj) == source
+
+
+def test_pause_gc(prepare_yaml, monkeypatch):
+    calls = []
+    monkeypatch.setattr(gc, "disable", lambda: calls.append("disable"))
+    monkeypatch.setattr(gc, "enable", lambda: calls.append("enable"))
+    deep_sort(prepare_yaml.load("b: 1\na: 2\n"))
+    assert calls == []
+
+    with pause_gc():
+        deep_sort(prepare_yaml.load("b: 1\na: 2\nd: {y: 1, x: 2}\n"))
+    assert calls == ["disable", "enable"] * 2
+
+
+def test_pause_gc_threads():
+    # the collector is enabled again after the last pause of all threads
+    first, second = _gc_paused(), _gc_paused()
+
+    def pause_in_thread():
+        with pause_gc():
+            second.__enter__()
+
+    assert gc.isenabled()
+    with pause_gc():
+        first.__enter__()
+    thread = threading.Thread(target=pause_in_thread)
+    thread.start()
+    thread.join()
+    first.__exit__(None, None, None)
+    assert not gc.isenabled()
+    second.__exit__(None, None, None)
+    assert gc.isenabled()
+
+
+def test_collect_stats(prepare_yaml):
+    obj = prepare_yaml.load("b: 1 # 1\na:\n  - y\n  - x\nc: [1, 2]\n")
+    assert current_stats() is None
+
+    with collect_stats() as stats:
+        deep_sort(obj)
+
+    assert current_stats() is None
+    assert stats.counts == dict(containers=3, items=7, sorted=2, comment_tokens=1)
+    assert stats.largest == 3
+    assert set(stats.timings) == {"order", "gather", "rebuild"}
+    assert json.loads(stats.to_json()) == stats.as_dict()
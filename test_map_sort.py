@@ -1,4 +1,5 @@
 import pytest
+from comments_sort import map_sort_before, natural_key, sort_unique, version_key
 
 
 @pytest.mark.parametrize(
@@ -255,7 +256,186 @@ a:
 - line 2
 """,
         ),
+        (
+            # comments after nested values
+            """\
+line 3: three
+line 2:
+  line 2.2: two-two # 2.2
+# 1.1
+line 1: one
+""",
+            """\
+# 1.1
+line 1: one
+line 2:
+  line 2.2: two-two # 2.2
+line 3: three
+""",
+        ),
+        (
+            # "last" comment after nested values
+            """\
+line 3:
+  line 3.1: three-one
+line 1: one
+# last
+""",
+            """\
+line 1: one
+line 3:
+  line 3.1: three-one
+# last
+""",
+        ),
+    ],
+)
+@pytest.mark.parametrize("inplace", [False, True])
+def test_map_sort(prepare_yaml, helpers, yaml_raw, yaml_sorted, inplace):
+    assert (
+        helpers.sort_map_and_str(prepare_yaml, yaml_raw, inplace=inplace) == yaml_sorted
+    )
+
+
+@pytest.mark.parametrize(
+    "yaml_raw, yaml_sorted, sort_args",
+    [
+        (
+            # reverse order
+            """\
+line 2: two # 2.1
+# 1.1
+line 1: one
+line 3: three
+""",
+            """\
+line 3: three
+line 2: two # 2.1
+# 1.1
+line 1: one
+""",
+            dict(reverse=True),
+        ),
+        (
+            # key function
+            """\
+B: two
+a: one
+""",
+            """\
+a: one
+B: two
+""",
+            dict(key=str.lower),
+        ),
+        (
+            # numbers in keys
+            """\
+node10: ten # 10
+# 2
+node2: two
+node1: one
+""",
+            """\
+node1: one
+# 2
+node2: two
+node10: ten # 10
+""",
+            dict(key=natural_key),
+        ),
+        (
+            # versions
+            """\
+v1.10.0: b
+2.0.0: d
+v1.9.3: a
+2.0.0-rc.1: c
+""",
+            """\
+v1.9.3: a
+v1.10.0: b
+2.0.0-rc.1: c
+2.0.0: d
+""",
+            dict(key=version_key),
+        ),
     ],
 )
-def test_map_sort(prepare_yaml, helpers, yaml_raw, yaml_sorted):
-    assert helpers.sort_map_and_str(prepare_yaml, yaml_raw) == yaml_sorted
+def test_map_sort_key(prepare_yaml, helpers, yaml_raw, yaml_sorted, sort_args):
+    obj = prepare_yaml.load(yaml_raw)
+    obj_sorted = map_sort_before(obj, **sort_args)
+    assert helpers.yaml_to_str(prepare_yaml, obj_sorted) == yaml_sorted
+
+
+def test_map_sort_unchanged(prepare_yaml):
+    obj = prepare_yaml.load("a: 1 # 1\nb: 2\n")
+    assert map_sort_before(obj) is obj
+
+
+@pytest.mark.parametrize(
+    "key, values",
+    [
+        (natural_key, ["10", "a", "a01", "a1", "a2", "a10", "a10b", "b"]),
+        (natural_key, [1, 2, 10, "a"]),
+        (
+            version_key,
+            [
+                "1.0",
+                "v1.2",
+                "1.9.3+build.1",
+                "v1.10.0",
+                "2.0.0-1",
+                "2.0.0-alpha",
+                "2.0.0-rc.2",
+                "2.0.0-rc.10",
+                "2.0.0",
+                "latest",
+                "next",
+            ],
+        ),
+    ],
+)
+def test_key_functions(key, values):
+    assert sorted(reversed(values), key=key) == values
+
+
+def test_map_sort_source_unchanged(prepare_yaml, helpers):
+    yaml_raw = "z: 1\nb:\n  y: 1 # y\n  # before a\n# also before a\na: 1\n"
+    obj = prepare_yaml.load(yaml_raw)
+    map_sort_before(obj)
+    source = helpers.yaml_to_str(prepare_yaml, prepare_yaml.load(yaml_raw))
+    assert helpers.yaml_to_str(prepare_yaml, obj) == source
+
+
+def test_map_sort_result_comments_edited(prepare_yaml, helpers):
+    # the result has its own lists of comments
+    yaml_raw = "# first\nb: 1\n# before a\na: 2 # a\n# end\n"
+    obj = prepare_yaml.load(yaml_raw)
+    obj_sorted = map_sort_before(obj)
+    for key in obj_sorted:
+        obj_sorted.yaml_set_comment_before_after_key(key, before="x", after="y")
+    source = helpers.yaml_to_str(prepare_yaml, prepare_yaml.load(yaml_raw))
+    assert helpers.yaml_to_str(prepare_yaml, obj) == source
+
+
+@pytest.mark.parametrize("inplace", [False, True])
+def test_sort_unique(prepare_yaml, helpers, inplace):
+    obj = prepare_yaml.load("""\
+B: 1 # big
+# before a
+a: 2
+# before b
+b:
+  x: 3
+c: 4
+""")
+    obj_sorted = sort_unique(obj, key=str.lower, inplace=inplace)
+    assert obj_sorted is obj or not inplace
+    assert helpers.yaml_to_str(prepare_yaml, obj_sorted) == """\
+# before a
+a: 2
+# before b
+B: 1 # big
+c: 4
+"""
@@ -0,0 +1,159 @@
+import pytest
+from comments_sort import deep_sort, merge_sorted
+
+
+@pytest.mark.parametrize(
+    "yaml_a, yaml_b, yaml_merged, merge_args",
+    [
+        (
+            # values of `b` win, nested maps are merged, comments are combined
+            """\
+# base
+a: 1 # a base
+c:
+  # about x
+  x: 1
+  z: 3
+e: 5 # e base
+# end of base
+""",
+            """\
+b: 2
+c: # c overlay
+  y: 2 # y
+  z: 4
+# before e
+e: 6 # e overlay
+f: 7
+# end of overlay
+""",
+            """\
+# base
+a: 1 # a base
+b: 2
+c: # c overlay
+  # about x
+  x: 1
+  y: 2 # y
+  z: 4
+# before e
+# e base
+e: 6 # e overlay
+f: 7
+# end of base
+# end of overlay
+""",
+            {},
+        ),
+        (
+            # sequences keep all items, items of `a` go first
+            """\
+# one
+- a
+- c # c
+- e
+# tail
+""",
+            """\
+- b
+# before c
+- c
+- f
+""",
+            """\
+# one
+- a
+- b
+- c # c
+# before c
+- c
+- e
+- f
+# tail
+""",
+            {},
+        ),
+        (
+            # keys equal with the key function are kept
+            """\
+B: 1
+a: 1
+""",
+            """\
+c: 2
+b: 2
+""",
+            """\
+c: 2
+B: 1
+b: 2
+a: 1
+""",
+            dict(key=str.lower, reverse=True),
+        ),
+        (
+            # overlay replaces other values
+            """\
+a: [1, 2]
+b:
+  x: 1
+""",
+            """\
+a: [3]
+b: 2
+""",
+            """\
+a: [3]
+b: 2
+""",
+            {},
+        ),
+    ],
+)
+def test_merge_sorted(prepare_yaml, helpers, yaml_a, yaml_b, yaml_merged, merge_args):
+    a = prepare_yaml.load(yaml_a)
+    b = prepare_yaml.load(yaml_b)
+    obj_merged = merge_sorted(a, b, **merge_args)
+    assert helpers.yaml_to_str(prepare_yaml, obj_merged) == yaml_merged
+
+
+def test_merge_sorted_sources_unchanged(prepare_yaml, helpers):
+    yaml_a = "a:\n  x: 1 # x\n# before b\nb: 1\nc:\n  y: 1\n# end of a\n"
+    yaml_b = "c:\n  z: 1\n# before d\nd: 1\n"
+    a = prepare_yaml.load(yaml_a)
+    b = prepare_yaml.load(yaml_b)
+    merge_sorted(a, b)
+    for obj, yaml_raw in ((a, yaml_a), (b, yaml_b)):
+        source = helpers.yaml_to_str(prepare_yaml, prepare_yaml.load(yaml_raw))
+        assert helpers.yaml_to_str(prepare_yaml, obj) == source
+
+
+def test_merge_sorted_result_comments_edited(prepare_yaml, helpers):
+    yaml_a = "# a\nb: 1 # b\n# c\nd: 2\n"
+    yaml_b = "# x\na: 1\nc: 3 # c\n# end\n"
+    a = prepare_yaml.load(yaml_a)
+    b = prepare_yaml.load(yaml_b)
+    obj_merged = merge_sorted(a, b)
+    for key in obj_merged:
+        obj_merged.yaml_set_comment_before_after_key(key, before="x", after="y")
+    for obj, yaml_raw in ((a, yaml_a), (b, yaml_b)):
+        source = helpers.yaml_to_str(prepare_yaml, prepare_yaml.load(yaml_raw))
+        assert helpers.yaml_to_str(prepare_yaml, obj) == source
+
+
+def test_merge_sorted_as_sort(prepare_yaml, helpers):
+    # the same result as sorting of concatenated sequences
+    yaml_a = "- d\n# b\n- b\n- f # f\n"
+    yaml_b = "- e\n- a # a\n# c\n- c\n"
+    a = deep_sort(prepare_yaml.load(yaml_a))
+    b = deep_sort(prepare_yaml.load(yaml_b))
+    both = deep_sort(prepare_yaml.load(yaml_a + yaml_b))
+    merged = helpers.yaml_to_str(prepare_yaml, merge_sorted(a, b))
+    assert merged == helpers.yaml_to_str(prepare_yaml, both)
+
+
+def test_merge_sorted_unsorted(prepare_yaml):
+    a = prepare_yaml.load("a: 1\nc:\n  y: 1\n  x: 2\n")
+    b = prepare_yaml.load("b: 1\nc:\n  x: 1\n")
+    with pytest.raises(ValueError):
+        merge_sorted(a, b)
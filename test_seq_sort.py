@@ -1,4 +1,12 @@
 import pytest
+from comments_sort import (
+    is_sorted,
+    seq_sort_before,
+    sort_seq_by,
+    sort_unique,
+    sorted_index,
+    version_key,
+)
 
 
 @pytest.mark.parametrize(
@@ -182,5 +190,234 @@ import pytest
         ),
     ],
 )
-def test_seq_sort(prepare_yaml, helpers, yaml_raw, yaml_sorted):
-    assert helpers.sort_seq_and_str(prepare_yaml, yaml_raw) == yaml_sorted
+@pytest.mark.parametrize("inplace", [False, True])
+def test_seq_sort(prepare_yaml, helpers, yaml_raw, yaml_sorted, inplace):
+    assert (
+        helpers.sort_seq_and_str(prepare_yaml, yaml_raw, inplace=inplace) == yaml_sorted
+    )
+
+
+@pytest.mark.parametrize(
+    "yaml_raw, yaml_sorted, sort_args",
+    [
+        (
+            # reverse order
+            """\
+- line 2 # 2.1
+# 1.1
+- line 1
+- line 3
+""",
+            """\
+- line 3
+- line 2 # 2.1
+# 1.1
+- line 1
+""",
+            dict(reverse=True),
+        ),
+        (
+            # key function
+            """\
+- name: b
+- name: a
+""",
+            """\
+- name: a
+- name: b
+""",
+            dict(key=lambda x: x["name"]),
+        ),
+    ],
+)
+def test_seq_sort_key(prepare_yaml, helpers, yaml_raw, yaml_sorted, sort_args):
+    obj = prepare_yaml.load(yaml_raw)
+    obj_sorted = seq_sort_before(obj, **sort_args)
+    assert helpers.yaml_to_str(prepare_yaml, obj_sorted) == yaml_sorted
+
+
+def test_seq_sort_unchanged(prepare_yaml):
+    obj = prepare_yaml.load("- a # 1\n- b\n")
+    assert seq_sort_before(obj) is obj
+
+
+@pytest.mark.parametrize(
+    "values, sort_args, result",
+    [
+        ([], {}, True),
+        ([1], {}, True),
+        ([1, 2, 2, 3], {}, True),
+        ([1, 3, 2], {}, False),
+        ([3, 2, 2, 1], dict(reverse=True), True),
+        ([3, 1, 2], dict(reverse=True), False),
+        (["b", "A"], {}, False),
+        (["A", "b"], dict(key=str.lower), True),
+        (["b", "A"], dict(key=str.lower), False),
+    ],
+)
+def test_is_sorted(values, sort_args, result):
+    assert is_sorted(values, **sort_args) == result
+    assert is_sorted(values, **sort_args) == (sorted(values, **sort_args) == values)
+
+
+@pytest.mark.parametrize(
+    "yaml_raw, yaml_sorted, sort_args",
+    [
+        (
+            # several fields, comments move with items
+            """# b 2
+- name: b
+  version: 2
+- name: a # a
+  version: 1
+- name: b
+  version: 1
+""",
+            """- name: a # a
+  version: 1
+- name: b
+  version: 1
+# b 2
+- name: b
+  version: 2
+""",
+            dict(fields=["name", "version"]),
+        ),
+        (
+            # missing fields and items which are not maps
+            """- plain
+- name: b
+- version: 1
+- name: a
+""",
+            """- name: a
+- name: b
+- plain
+- version: 1
+""",
+            dict(fields="name"),
+        ),
+        (
+            # missing go first
+            """- name: b
+- version: 1
+- name: a
+""",
+            """- version: 1
+- name: a
+- name: b
+""",
+            dict(fields="name", missing="first"),
+        ),
+        (
+            # missing stay last in descending order
+            """- version: 1
+- name: a
+- name: b
+""",
+            """- name: b
+- name: a
+- version: 1
+""",
+            dict(fields="name", reverse=True),
+        ),
+        (
+            # values of different types
+            """- name: x
+- name: null
+- name: [1]
+- name: 2
+- name: 1.5
+- name: true
+""",
+            """- name: true
+- name: 1.5
+- name: 2
+- name: x
+- name: [1]
+- name:
+""",
+            dict(fields="name"),
+        ),
+    ],
+)
+@pytest.mark.parametrize("inplace", [False, True])
+def test_sort_seq_by(prepare_yaml, helpers, yaml_raw, yaml_sorted, sort_args, inplace):
+    obj = prepare_yaml.load(yaml_raw)
+    obj_sorted = sort_seq_by(obj, inplace=inplace, **sort_args)
+    assert obj_sorted is obj or not inplace
+    assert helpers.yaml_to_str(prepare_yaml, obj_sorted) == yaml_sorted
+
+
+def test_sort_seq_by_missing(prepare_yaml):
+    obj = prepare_yaml.load("- name: a\n")
+    with pytest.raises(ValueError):
+        sort_seq_by(obj, "name", missing="middle")
+
+
+def test_sorted_index_version(prepare_yaml):
+    obj = prepare_yaml.load("- v1.10.0\n- v1.9.3\n- v1.9.3-rc.1\n")
+    assert sorted_index(obj, key=version_key) == [2, 1, 0]
+
+
+@pytest.mark.parametrize(
+    "yaml_raw, yaml_sorted, sort_args",
+    [
+        (
+            # comments of dropped items go before the kept one
+            """\
+# c
+- x # one
+# d
+- y
+- x # two
+# e
+- x
+- a
+# end
+""",
+            """\
+- a
+# c
+# two
+# e
+- x # one
+# d
+- y
+# end
+""",
+            {},
+        ),
+        (
+            # the first item in the source is kept
+            """\
+- B
+- a
+- b
+""",
+            """\
+- B
+- a
+""",
+            dict(key=str.lower, reverse=True),
+        ),
+        (
+            # no duplicates
+            """\
+- b
+- a
+""",
+            """\
+- a
+- b
+""",
+            {},
+        ),
+    ],
+)
+@pytest.mark.parametrize("inplace", [False, True])
+def test_sort_unique(prepare_yaml, helpers, yaml_raw, yaml_sorted, sort_args, inplace):
+    obj = prepare_yaml.load(yaml_raw)
+    obj_sorted = sort_unique(obj, inplace=inplace, **sort_args)
+    assert obj_sorted is obj or not inplace
+    assert helpers.yaml_to_str(prepare_yaml, obj_sorted) == yaml_sorted
@@ -0,0 +1,66 @@
+import os
+from functools import partial
+
+import pytest
+import text_splice
+import yaml_sort
+from sort_cache import SortCache, _library_digest
+
+
+def test_get_put(tmp_path):
+    cache = SortCache(str(tmp_path), dict(reverse=False))
+    assert cache.get("b: 1\na: 2\n") is None
+
+    cache.put("b: 1\na: 2\n", "a: 2\nb: 1\n")
+    cache.put("a: 2\nb: 1\n", "a: 2\nb: 1\n")
+    assert cache.get("b: 1\na: 2\n") == "a: 2\nb: 1\n"
+    assert cache.get("a: 2\nb: 1\n") == "a: 2\nb: 1\n"
+
+    # other options
+    assert SortCache(str(tmp_path), dict(reverse=True)).get("b: 1\na: 2\n") is None
+    key = SortCache(str(tmp_path), dict(map_key=str.lower, reverse=False))
+    assert key.get("b: 1\na: 2\n") is None
+
+
+@pytest.mark.parametrize(
+    "key", [lambda s: s.lower(), partial(str.lower), (lambda: lambda s: s)()]
+)
+def test_unnamed_key(tmp_path, key):
+    with pytest.raises(ValueError, match="unnamed function"):
+        SortCache(str(tmp_path), dict(map_key=key))
+
+
+def test_library_digest(tmp_path, monkeypatch):
+    digest = _library_digest()
+    # minimal diffs are spliced by another module, its changes count too
+    source = tmp_path / "text_splice.py"
+    source.write_bytes(open(text_splice.__file__, "rb").read() + b"\n")
+    monkeypatch.setattr(text_splice, "__file__", str(source))
+    assert _library_digest() != digest
+
+
+def test_prune(tmp_path):
+    cache = SortCache(str(tmp_path), {}, max_size=2 * 4096)
+    for i in range(4):
+        cache.put(f"a: {i}\n", f"a: {i}\n")
+    for i, name in enumerate(sorted(os.listdir(tmp_path))):
+        os.utime(os.path.join(str(tmp_path), name), (i, i))
+    cache.get("a: 0\n")  # recently used
+
+    cache.prune()
+
+    assert len(os.listdir(tmp_path)) == 2
+    assert cache.get("a: 0\n") == "a: 0\n"
+
+
+def test_main(tmp_path, monkeypatch):
+    (tmp_path / "a.yaml").write_text("b: 1\na: 2\n")
+    (tmp_path / "b.yaml").write_text("a: 2\nb: 1\n")
+    args = ["--check", "--cache-dir", str(tmp_path / "cache"), f"{tmp_path}/*.yaml"]
+    assert yaml_sort.main(args) == 1
+
+    def sort_text(*args, **kwargs):
+        raise AssertionError("must not be called")
+
+    monkeypatch.setattr(yaml_sort, "sort_text", sort_text)
+    assert yaml_sort.main(args) == 1
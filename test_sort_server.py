@@ -0,0 +1,180 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from sort_server import Client, handle_request
+from yaml_sort import main
+
+UNSORTED = """\
+b: two # 2
+# 1
+a: [2, 1]
+"""
+SORTED = """\
+# 1
+a: [2, 1]
+b: two # 2
+"""
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    path = tmp_path_factory.mktemp("server") / "sort.sock"
+    script = os.path.join(os.path.dirname(__file__), "yaml_sort.py")
+    process = subprocess.Popen([sys.executable, script, "--serve", str(path)])
+    deadline = time.monotonic() + 10
+    while not path.exists():
+        assert process.poll() is None and time.monotonic() < deadline
+        time.sleep(0.05)
+    yield str(path)
+    process.terminate()
+    assert process.wait(10) == 0
+    assert not path.exists()
+
+
+@pytest.mark.parametrize(
+    "request_, response",
+    [
+        (
+            dict(id=1, text=UNSORTED),
+            dict(id=1, path=None, changed=True, error=None, text=SORTED),
+        ),
+        (
+            dict(text=SORTED, op="check"),
+            dict(id=None, path=None, changed=False, error=None, unsorted=[]),
+        ),
+        (
+            dict(text=UNSORTED, op="check", options=dict(sort_seqs=True)),
+            dict(
+                id=None,
+                path=None,
+                changed=True,
+                error=None,
+                unsorted=[
+                    dict(path="$", key="a", line=3),
+                    dict(path="$.a", key=1, line=3),
+                ],
+            ),
+        ),
+        (
+            dict(text="b: 1\na: 1\n", options=dict(order={"$": ["b"]})),
+            dict(id=None, path=None, changed=False, error=None, text="b: 1\na: 1\n"),
+        ),
+        (
+            dict(text="a10: 1\na9: 1\n", options=dict(key="natural", reverse=True)),
+            dict(
+                id=None, path=None, changed=False, error=None, text="a10: 1\na9: 1\n"
+            ),
+        ),
+    ],
+)
+def test_handle_request(request_, response):
+    assert handle_request(request_) == response
+
+
+@pytest.mark.parametrize(
+    "request_, error",
+    [
+        ([], "not an object"),
+        (dict(), "path or text is required"),
+        (dict(text="a: 1", op="x"), "unknown op 'x'"),
+        (dict(text="a: 1", options=dict(x=1)), "unknown options: x"),
+        (dict(text="a: 1", options=dict(key="x")), "unknown key 'x'"),
+        (dict(text="a: 1", options=dict(order=[])), "key order must be a map"),
+        (dict(text="a: 1", options=dict(order={"$": [[]]})), "key must be a scalar"),
+        (dict(text="a: 1", options=dict(order_file="missing")), "No such file"),
+        (dict(text="a: [1"), "while parsing a flow sequence"),
+        (dict(path="missing.yaml"), "No such file"),
+        (dict(text="a: " + "[" * 500 + "]" * 500), "recursion"),
+    ],
+)
+def test_handle_request_errors(request_, error):
+    response = handle_request(request_)
+    assert response["changed"] is False
+    assert error in response["error"]
+    # the next request isn't affected
+    assert handle_request(dict(text=UNSORTED))["text"] == SORTED
+
+
+def test_order_file_reloaded(tmp_path):
+    order = tmp_path / "order.yaml"
+    order.write_text("$: [b]\n")
+    request = dict(text="a: 1\nb: 1\n", options=dict(order_file=str(order)))
+    assert handle_request(request)["text"] == "b: 1\na: 1\n"
+    order.write_text("$: [a]\n")
+    os.utime(order, (0, 0))
+    assert handle_request(request)["text"] == "a: 1\nb: 1\n"
+
+
+def test_server(server, tmp_path):
+    (tmp_path / "a.yaml").write_text(UNSORTED)
+    with Client(server) as client:
+        assert client.request(dict(id="x", path=str(tmp_path / "a.yaml"))) == dict(
+            id="x", path=str(tmp_path / "a.yaml"), changed=True, error=None, text=SORTED
+        )
+        # the connection is kept after errors
+        response = client.request(dict(id=2, text="a: [1"))
+        assert response["id"] == 2 and response["error"]
+        client._file.write(b"{not json\n")
+        client._file.flush()
+        assert "invalid JSON" in client._file.readline().decode()
+        response = client.request(dict(text="a: " + "[" * 500 + "]" * 500))
+        assert "recursion" in response["error"]
+        assert client.request(dict(text="b: 1\na: 1\n"))["text"] == "a: 1\nb: 1\n"
+
+
+def test_server_connections(server):
+    clients = [Client(server) for _ in range(3)]
+    try:
+        for i, client in enumerate(reversed(clients)):
+            assert client.request(dict(id=i, text=UNSORTED))["id"] == i
+    finally:
+        for client in clients:
+            client.close()
+
+
+def test_server_running(server, capsys):
+    assert main(["--serve", server]) == 2
+    assert "already running" in capsys.readouterr().err
+
+
+def test_cli(server, tmp_path, capsys):
+    (tmp_path / "a.yaml").write_text(UNSORTED)
+    (tmp_path / "order.yaml").write_text("$: [b]\n")
+    paths = [str(tmp_path / "a.yaml"), str(tmp_path / "missing.yaml")]
+    assert main(["--server", server, "--check", *paths]) == 2
+    err = capsys.readouterr().err
+    assert f"{paths[0]}:3: $: 'a' is out of order" in err
+    assert f"error: {paths[1]}" in err
+
+    (tmp_path / "latin1.yaml").write_bytes(b"a: \xe9\n")
+    latin1 = str(tmp_path / "latin1.yaml")
+    assert main(["--server", server, "--check", latin1, paths[0]]) == 2
+    err = capsys.readouterr().err
+    assert f"error: {latin1}" in err and "can't decode" in err
+    assert f"{paths[0]}:3: $: 'a' is out of order" in err
+
+    # the order decides with --diff too
+    (tmp_path / "format.yaml").write_text("a:   1\n")
+    format_path = str(tmp_path / "format.yaml")
+    assert main(["--server", server, "--check", "--diff", format_path]) == 0
+    assert main(["--server", server, "--check", "--diff", paths[0]]) == 1
+    assert "+b: two # 2" in capsys.readouterr().out
+
+    order = str(tmp_path / "order.yaml")
+    assert main(["--server", server, "--order", order, paths[0]]) == 0
+    assert capsys.readouterr().out == UNSORTED
+    assert main(["--server", server, "--sort-seqs", paths[0]]) == 0
+    assert capsys.readouterr().out == SORTED.replace("[2, 1]", "[1, 2]")
+
+    assert main(["--server", server, "-i", paths[0]]) == 0
+    assert (tmp_path / "a.yaml").read_text() == SORTED
+
+
+def test_cli_no_server(tmp_path, capsys):
+    (tmp_path / "a.yaml").write_text(UNSORTED)
+    socket_path = str(tmp_path / "none.sock")
+    assert main(["--server", socket_path, str(tmp_path / "a.yaml")]) == 2
+    assert "none.sock" in capsys.readouterr().err
@@ -0,0 +1,185 @@
+import pytest
+from comments_sort import deep_sort
+from text_splice import splice_sort
+
+
+@pytest.mark.parametrize(
+    "yaml_raw, yaml_sorted, sorted_args",
+    [
+        (
+            # formatting is kept: indentation, quotes, flow style
+            """\
+# header
+b:
+    y: 'one'   # 1
+    x: "two"
+a: {p: 1, q: 2}
+""",
+            """\
+a: {p: 1, q: 2}
+# header
+b:
+    x: "two"
+    y: 'one'   # 1
+""",
+            {},
+        ),
+        (
+            # comments after a nested block go with the next item
+            """\
+c:
+  - b
+  - a
+  # about a
+
+a: 1 # 1
+# about b
+b: 2
+# end
+""",
+            """\
+  # about a
+
+a: 1 # 1
+# about b
+b: 2
+c:
+  - a
+  - b
+# end
+""",
+            {},
+        ),
+        (
+            # compact maps in sequences keep the dash
+            """\
+- name: b
+  image: y
+- name: a  # a
+  image: x
+""",
+            """\
+- image: y
+  name: b
+- image: x
+  name: a  # a
+""",
+            dict(sort_seqs=False),
+        ),
+        (
+            # comments between a key and its nested block go with the first item
+            """\
+k:
+  # about y
+  y: 1
+  x: 2
+l:  # inline
+  # stays
+  y: 1
+  x: 2
+""",
+            """\
+k:
+  x: 2
+  # about y
+  y: 1
+l:  # inline
+  # stays
+  x: 2
+  y: 1
+""",
+            {},
+        ),
+        (
+            # block scalars
+            """\
+b: |
+  # not a comment
+  text
+a: >
+  folded
+""",
+            """\
+a: >
+  folded
+b: |
+  # not a comment
+  text
+""",
+            {},
+        ),
+        (
+            # aliases stay after their anchors
+            """\
+y: &y
+  b: 1
+  a: 2
+z: *y
+x: 0
+""",
+            """\
+x: 0
+y: &y
+  a: 2
+  b: 1
+z: *y
+""",
+            {},
+        ),
+        (
+            # options of `deep_sort`
+            """\
+- b
+- a
+""",
+            """\
+- b
+- a
+""",
+            dict(sort_seqs=False),
+        ),
+    ],
+)
+def test_splice_sort(prepare_yaml, yaml_raw, yaml_sorted, sorted_args):
+    assert splice_sort(prepare_yaml, yaml_raw, **sorted_args) == yaml_sorted
+
+
+@pytest.mark.parametrize(
+    "yaml_raw",
+    [
+        # order of flow style containers is changed
+        "a: [2, 1]\n",
+        "a: {b: [2, 1]}\n",
+        # several documents
+        "b: 1\na: 2\n---\nc: 1\n",
+        # merge keys
+        "x: &x {b: 1}\ny:\n  <<: *x\n  a: 2\n",
+        # an alias would move before its anchor
+        "b: &x\n  k: 1\na: *x\n",
+        # comment before the first key of a compact map
+        "- b: 1\n  # a\n  a: 2\n",
+        # comment lines may be a part of a block scalar
+        "b: |\n  text\n\n# c\na: 1\n",
+        # ordered maps have no positions of keys
+        "x: !!omap\n- b: 1\n- a: 2\nz: 1\n",
+    ],
+)
+def test_splice_sort_unsupported(prepare_yaml, yaml_raw):
+    assert splice_sort(prepare_yaml, yaml_raw) is None
+
+
+@pytest.mark.parametrize(
+    "yaml_raw",
+    [
+        "# 1\nb:\n  d: 1\n  # 2\n  c: 2 # 3\n# 4\na:\n- y\n# 5\n- x\n# 6\n",
+        "c:\n- b: 1\n  a: 2\nb:\n- y\n- x\na: 3\n",
+        "z: 1\ny:\n  # y\n  x: 2\n  w: 1\n\nx: 0\n",
+    ],
+)
+@pytest.mark.parametrize("sorted_args", [{}, dict(reverse=True)])
+def test_splice_sort_as_dump(prepare_yaml, helpers, yaml_raw, sorted_args):
+    # the source is formatted as `ruamel.yaml` does, so results must be the same
+    assert helpers.yaml_to_str(prepare_yaml, prepare_yaml.load(yaml_raw)) == yaml_raw
+    obj = deep_sort(prepare_yaml.load(yaml_raw), **sorted_args)
+    target = helpers.yaml_to_str(prepare_yaml, obj)
+    assert splice_sort(prepare_yaml, yaml_raw, **sorted_args) == target
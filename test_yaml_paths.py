@@ -0,0 +1,50 @@
+import pickle
+
+import pytest
+from yaml_paths import WILDCARD, KeyOrder, format_path, parse_path
+
+
+@pytest.mark.parametrize(
+    "expr, segments",
+    [
+        ("$", []),
+        ("$.spec.containers[*]", ["spec", "containers", WILDCARD]),
+        ("$.*.name", [WILDCARD, "name"]),
+        ("$.items[0]", ["items", 0]),
+        ("""$["a.b"]['c[d]']""", ["a.b", "c[d]"]),
+    ],
+)
+def test_parse_path(expr, segments):
+    assert parse_path(expr) == segments
+
+
+@pytest.mark.parametrize(
+    "segments, expr",
+    [
+        ([], "$"),
+        (["spec", "containers", 0, WILDCARD], "$.spec.containers[0][*]"),
+        (["a.b", "*", '"c', 1.5, None], """$["a.b"]["*"]['"c']["1.5"].None"""),
+    ],
+)
+def test_format_path(segments, expr):
+    assert format_path(segments) == expr
+    assert format_path(parse_path(expr)) == expr
+
+
+@pytest.mark.parametrize("expr", ["", "spec", "$spec", "$.a[", "$.a[x]", "$..a"])
+def test_parse_path_invalid(expr):
+    with pytest.raises(ValueError):
+        parse_path(expr)
+
+
+def test_key_order():
+    order = KeyOrder({"$.a": ["x", "y", "x"], "$.*": ["z"], "$.a[*]": ["w"]})
+    root = (order.root,)
+    assert KeyOrder.priority(root) is None
+    # key is preferred to wildcard
+    assert KeyOrder.priority(KeyOrder.descend(root, "a")) == ["x", "y"]
+    assert KeyOrder.priority(KeyOrder.descend(root, "b")) == ["z"]
+    nodes = KeyOrder.descend(KeyOrder.descend(root, "a"), 3)
+    assert KeyOrder.priority(nodes) == ["w"]
+    assert KeyOrder.descend(KeyOrder.descend(root, "b"), 3) == ()
+    assert repr(pickle.loads(pickle.dumps(order))) == repr(order)
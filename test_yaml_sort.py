@@ -0,0 +1,246 @@
+import json
+
+import pytest
+from yaml_sort import expand_paths, main, sort_files
+
+UNSORTED = """\
+b: two # 2
+# 1
+a: one
+"""
+SORTED = """\
+# 1
+a: one
+b: two # 2
+"""
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "unsorted.yaml").write_text(UNSORTED)
+    (tmp_path / "sub" / "sorted.yaml").write_text(SORTED)
+    return tmp_path
+
+
+def test_expand_paths(files):
+    assert expand_paths([f"{files}/**/*.yaml", f"{files}/unsorted.yaml", "x"]) == [
+        f"{files}/sub/sorted.yaml",
+        f"{files}/unsorted.yaml",
+        "x",
+    ]
+
+
+def test_stdout(files, capsys):
+    assert main([str(files / "unsorted.yaml")]) == 0
+    assert capsys.readouterr().out == SORTED
+
+
+def test_no_files(files, capsys):
+    assert main([]) == 0
+    assert main(["--check", f"{files}/*.yml"]) == 0
+    assert capsys.readouterr() == ("", "")
+
+
+def test_check(files, capsys):
+    assert main(["--check", str(files / "sub" / "sorted.yaml")]) == 0
+    assert main(["--check", f"{files}/**/*.yaml"]) == 1
+    assert "unsorted.yaml" in capsys.readouterr().err
+    assert (files / "unsorted.yaml").read_text() == UNSORTED
+
+
+@pytest.mark.parametrize("mode", [[], ["--diff"], ["--in-place"]])
+def test_check_order_only(files, capsys, mode):
+    # formatting which dumping changes doesn't make a file unsorted
+    (files / "format.yaml").write_text("a:   1\nb: 2\n")
+    assert main(["--check", *mode, str(files / "format.yaml")]) == 0
+    assert capsys.readouterr().out == ""
+    assert (files / "format.yaml").read_text() == "a:   1\nb: 2\n"
+
+    assert main(["--check", *mode, str(files / "unsorted.yaml")]) == 1
+    out = capsys.readouterr().out
+    assert ("+b: two # 2" in out) is ("--diff" in mode)
+    in_place = "--in-place" in mode
+    assert ((files / "unsorted.yaml").read_text() == SORTED) is in_place
+
+
+def test_check_paths(files, capsys):
+    (files / "nested.yaml").write_text("a:\n  d: 1\n  c: 2\nb: [2, 1]\n")
+    assert main(["--check", "--sort-seqs", str(files / "nested.yaml")]) == 1
+    assert capsys.readouterr().err == (
+        f"{files}/nested.yaml:3: $.a: 'c' is out of order\n"
+        f"{files}/nested.yaml:4: $.b: 1 is out of order\n"
+        f"would sort {files}/nested.yaml\n"
+    )
+
+
+def test_seq_of_maps(files, capsys):
+    (files / "pod.yaml").write_text("containers:\n- name: b\n- name: a\n")
+    assert main(["--check", "--sort-seqs", str(files / "pod.yaml")]) == 0
+    assert main(["--sort-seqs", str(files / "pod.yaml")]) == 0
+    assert capsys.readouterr().out == "containers:\n- name: b\n- name: a\n"
+
+
+def test_diff(files, capsys):
+    assert main(["--diff", f"{files}/**/*.yaml"]) == 0
+    out = capsys.readouterr().out
+    assert out.startswith(f"--- {files}/unsorted.yaml\n+++ {files}/unsorted.yaml\n")
+    assert "\n-b: two # 2\n" in out
+    assert "\n+b: two # 2\n" in out
+    assert "sub/sorted.yaml" not in out
+
+
+def test_in_place(files):
+    mtime = (files / "sub" / "sorted.yaml").stat().st_mtime_ns
+    assert main(["--in-place", f"{files}/**/*.yaml"]) == 0
+    assert (files / "unsorted.yaml").read_text() == SORTED
+    assert (files / "sub" / "sorted.yaml").stat().st_mtime_ns == mtime
+
+
+def test_minimal_diff(files, capsys):
+    (files / "format.yaml").write_text("b:   'two' # 2\n# 1\na: {x: 1}\n")
+    assert main(["--minimal-diff", str(files / "format.yaml")]) == 0
+    assert capsys.readouterr().out == "# 1\na: {x: 1}\nb:   'two' # 2\n"
+
+    # flow style with changed order is dumped
+    (files / "flow.yaml").write_text("b: {y: 1, x: 2}\na: 1\n")
+    assert main(["--minimal-diff", str(files / "flow.yaml")]) == 0
+    assert capsys.readouterr().out == "a: 1\nb: {x: 2, y: 1}\n"
+
+    # ordered maps have no positions of keys, the document is dumped
+    (files / "omap.yaml").write_text("x: !!omap\n- b: 1\nz: 1\ny: 2\n")
+    assert main(["--minimal-diff", str(files / "omap.yaml")]) == 0
+    assert capsys.readouterr().out == "x: !!omap\n- b: 1\ny: 2\nz: 1\n"
+
+
+def test_unique(files, capsys):
+    (files / "dup.yaml").write_text("b: [y, x, y]\na: 1\nb: 2\n")
+    assert main(["--check", "--sort-seqs", str(files / "dup.yaml")]) == 2
+    assert main(["--check", "--unique", "--sort-seqs", str(files / "dup.yaml")]) == 1
+    assert main(["--unique", "--sort-seqs", str(files / "dup.yaml")]) == 0
+    assert capsys.readouterr().out == "a: 1\nb: [x, y]\n"
+
+
+def test_options(files, capsys):
+    (files / "seq.yaml").write_text("- B\n- a\n- c\n")
+    args = ["--sort-seqs", "--key", "ignore-case", "-r", str(files / "seq.yaml")]
+    assert main(args) == 0
+    assert capsys.readouterr().out == "- c\n- B\n- a\n"
+
+
+@pytest.mark.parametrize(
+    "key, source, target",
+    [
+        ("natural", "node10: 1\nnode2: 2\n", "node2: 2\nnode10: 1\n"),
+        ("version", "v1.10.0: 1\nv1.9.3: 2\n", "v1.9.3: 2\nv1.10.0: 1\n"),
+    ],
+)
+def test_keys(files, capsys, key, source, target):
+    (files / "keys.yaml").write_text(source)
+    assert main(["--key", key, str(files / "keys.yaml")]) == 0
+    assert capsys.readouterr().out == target
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_order(files, capsys, jobs):
+    (files / "order.yaml").write_text("$: [name, version]\n")
+    (files / "a.yaml").write_text("b: 1\nversion: 2\nname: a\n")
+    (files / "b.yaml").write_text("version: 1\nname: b\n")
+    args = ["--order", str(files / "order.yaml"), "--jobs", str(jobs)]
+    assert main(args + [str(files / "a.yaml"), str(files / "b.yaml")]) == 0
+    out = capsys.readouterr().out
+    assert out == "name: a\nversion: 2\nb: 1\nname: b\nversion: 1\n"
+
+
+@pytest.mark.parametrize(
+    "order, error",
+    [
+        ("- name\n", "must be a map"),
+        ("$: name\n", "must be a map"),
+        ("x: [name]\n", "must start with '$'"),
+        ("1: [name]\n", "must be a string: 1"),
+        ("$.a: [[name]]\n", "$.a: key must be a scalar: ['name']"),
+        ("$: [{name: 1}]\n", "$: key must be a scalar"),
+    ],
+)
+def test_order_invalid(files, capsys, order, error):
+    (files / "order.yaml").write_text(order)
+    assert main(["--order", str(files / "order.yaml"), str(files / "a.yaml")]) == 2
+    err = capsys.readouterr().err
+    assert "order.yaml" in err and error in err
+
+
+def test_errors(files, capsys):
+    (files / "bad.yaml").write_text("a: [\n")
+    assert main([str(files / "bad.yaml"), str(files / "missing.yaml")]) == 2
+    err = capsys.readouterr().err
+    assert "bad.yaml" in err
+    assert "missing.yaml" in err
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_not_utf8(files, capsys, jobs):
+    (files / "latin1.yaml").write_bytes("b: \xe9\na: 1\n".encode("latin-1"))
+    paths = [str(files / "latin1.yaml"), str(files / "unsorted.yaml")]
+    assert main(["--jobs", jobs, "--check", *paths]) == 2
+    err = capsys.readouterr().err
+    assert "latin1.yaml" in err and "can't decode" in err
+    assert "would sort" in err and "unsorted.yaml" in err
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_sort_files(files, jobs):
+    for i in range(5):
+        (files / f"{i}.yaml").write_text(f"b: {i}\na: {i}\n")
+    paths = [str(files / f"{i}.yaml") for i in range(5)] + [str(files / "missing")]
+
+    results = list(sort_files(paths, jobs=jobs))
+
+    assert [r.path for r in results] == paths
+    assert [r.target for r in results[:5]] == [f"a: {i}\nb: {i}\n" for i in range(5)]
+    assert all(r.changed for r in results[:5])
+    assert results[5].error is not None
+    assert not results[5].changed
+
+
+def test_jobs(files):
+    assert main(["--jobs", "2", "--check", f"{files}/**/*.yaml"]) == 1
+
+
+@pytest.mark.parametrize("jobs", ["-1", "x"])
+def test_jobs_invalid(files, capsys, jobs):
+    with pytest.raises(SystemExit) as e:
+        main(["--jobs", jobs, str(files / "unsorted.yaml")])
+    assert e.value.code == 2
+    assert "--jobs" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_sort_files_unexpected_error(files, jobs):
+    # too deeply nested for the loader, other files are sorted anyway
+    (files / "deep.yaml").write_text("a: " + "[" * 500 + "]" * 500 + "\n")
+    paths = [str(files / "unsorted.yaml"), str(files / "deep.yaml")] * 2
+
+    results = list(sort_files(paths, jobs=jobs))
+
+    assert [r.target for r in results[::2]] == [SORTED, SORTED]
+    assert all("RecursionError" in r.error for r in results[1::2])
+
+
+def test_documents(files, capsys):
+    (files / "stream.yaml").write_text("b: 1\na: 2\n---\nd: 3\nc: 4\n")
+    assert main([str(files / "stream.yaml")]) == 0
+    assert capsys.readouterr().out == "a: 2\nb: 1\n---\nc: 4\nd: 3\n"
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_stats(files, capsys, jobs):
+    assert main(["--stats", "--jobs", jobs, "--diff", f"{files}/**/*.yaml"]) == 0
+    stats = json.loads(capsys.readouterr().err)
+    assert stats["counts"]["containers"] == 2
+    assert stats["counts"]["sorted"] == 1
+    assert set(stats["timings"]) == {"load", "order", "gather", "rebuild", "dump"}
+
+    assert main(["--stats", "--jobs", jobs, "--check", f"{files}/**/*.yaml"]) == 1
+    stats = json.loads(capsys.readouterr().err.split("\n", 2)[2])
+    assert set(stats["timings"]) == {"load", "check"}
@@ -0,0 +1,265 @@
+"""Sorting by moving lines of the source text instead of dumping documents.
+
+Every block map and sequence occupies a range of lines, every item of it
+takes lines from its first line (with comments before it) up to the next
+item. Sorting permutes these ranges in the same order as `deep_sort`,
+so the rest of the text (formatting, quotes, indentation) stays untouched
+and diffs are minimal.
+
+Positions of items come from the loader (`.lc` of maps and sequences).
+If a container can't be handled (flow style with changed order, merge keys,
+items on the same line, several documents), an alias would move before its
+anchor or duplicates are dropped, `splice_sort` returns None and the document
+has to be dumped as usual.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+
+import ruamel.yaml
+from comments_sort import deep_sort, record_orders
+from ruamel.yaml.comments import CommentedMap, CommentedSeq
+
+
+class _Unsupported(Exception):
+    """The text can't be spliced, the document must be dumped."""
+
+
+@dataclass(slots=True)
+class _Block:
+    """Positions of items of a container in the source text."""
+
+    obj: CommentedMap | CommentedSeq
+    flow: bool
+    # keys (or indices) in the source order
+    keys: list[Any] = field(default_factory=list)
+    # the first line of every item (key or dash)
+    lines: list[int] = field(default_factory=list)
+    # column of keys (or dashes)
+    column: int = 0
+    # nested blocks, None for scalars and aliases
+    children: list["_Block | None"] = field(default_factory=list)
+    # text of the last scalar of an item may look like comment lines
+    unsafe_tails: list[bool] = field(default_factory=list)
+    # comments before the first item belong to it (not to the parent's key)
+    own_start: bool = False
+
+
+def _is_comment_line(line: str) -> bool:
+    text = line.lstrip()
+    return not text or text.startswith("#")
+
+
+def _scan_back(lines: list[str], pos: int, stop: int) -> int:
+    """Move `pos` back over comment and blank lines, but not before `stop`."""
+    while pos > stop and _is_comment_line(lines[pos - 1]):
+        pos -= 1
+    return pos
+
+
+def _unsafe_tail(value: Any) -> bool:
+    """Check if the text of the last scalar of `value` may contain comment lines.
+
+    Block scalars and multi-line quoted scalars can contain lines starting
+    with "#", then their values contain a line break or "#".
+    """
+    while isinstance(value, (CommentedMap, CommentedSeq)) and value:
+        value = value[next(reversed(value))] if isinstance(value, dict) else value[-1]
+    return isinstance(value, str) and ("\n" in value or "#" in value)
+
+
+def _item_column(lines: list[str], line: int, column: int, is_map: bool) -> int:
+    """Column of a key or a dash of a sequence item (`column` is for its value)."""
+    if is_map:
+        return column
+    dash = lines[line].rfind("-", 0, column)
+    if dash < 0 or lines[line][dash + 1 : column].strip():
+        raise _Unsupported(f"no dash for the item at line {line + 1}")
+    return dash
+
+
+def _collect(
+    obj: CommentedMap | CommentedSeq, lines: list[str], seen: set[int]
+) -> _Block:
+    """Collect positions of items of `obj` and nested containers."""
+    seen.add(id(obj))
+    block = _Block(obj, obj.fa.flow_style())
+    block.own_start = bool(obj.ca.comment and obj.ca.comment[1])
+    if not obj:
+        return block
+    is_map = isinstance(obj, CommentedMap)
+    if is_map and obj.merge:
+        raise _Unsupported("merge keys")
+
+    columns = set()
+    # e.g. `!!omap` and `!!set` are constructed without positions
+    data = obj.lc.data or {}
+    for key, value in obj.items() if is_map else enumerate(obj):
+        position = data.get(key)
+        if position is None:
+            raise _Unsupported(f"no position for {key!r}")
+        line, column = position[0], position[1]
+        if block.lines and line <= block.lines[-1]:
+            if block.flow:
+                # items of flow containers may share lines
+                line = block.lines[-1]
+            else:
+                raise _Unsupported(f"items on the same line {line + 1}")
+        block.keys.append(key)
+        block.lines.append(line)
+        if not block.flow:
+            columns.add(_item_column(lines, line, column, is_map))
+        if isinstance(value, (CommentedMap, CommentedSeq)) and id(value) not in seen:
+            block.children.append(_collect(value, lines, seen))
+        else:
+            # aliases are left at their places
+            block.children.append(None)
+        block.unsafe_tails.append(_unsafe_tail(value))
+
+    if not block.flow:
+        if len(columns) != 1:
+            raise _Unsupported(f"items at different columns at line {line + 1}")
+        block.column = columns.pop()
+        for line in block.lines[1:]:
+            if lines[line][: block.column].strip():
+                raise _Unsupported(f"unexpected text at line {line + 1}")
+    return block
+
+
+def _has_changes(block: _Block, orders: dict[int, Any]) -> bool:
+    return id(block.obj) in orders or any(
+        child is not None and _has_changes(child, orders) for child in block.children
+    )
+
+
+def _render(
+    lines: list[str],
+    block: _Block,
+    start: int,
+    end: int,
+    orders: dict[int, Any],
+    out: list[str],
+) -> None:
+    """Append lines `[start, end)` of `block` with reordered items to `out`."""
+    if block.flow or not block.keys:
+        if _has_changes(block, orders):
+            raise _Unsupported(f"flow style at line {start + 1}")
+        out.extend(lines[start:end])
+        return
+
+    # comments after an item go with the next item
+    starts = [start]
+    for i in range(1, len(block.lines)):
+        item_start = _scan_back(lines, block.lines[i], block.lines[i - 1] + 1)
+        if item_start < block.lines[i] and block.unsafe_tails[i - 1]:
+            raise _Unsupported(f"can't find comments before line {block.lines[i]}")
+        starts.append(item_start)
+    ends = starts[1:] + [end]
+
+    chunks = []
+    for i, child in enumerate(block.children):
+        chunk: list[str] = []
+        if child is None:
+            chunk.extend(lines[starts[i] : ends[i]])
+        else:
+            child_start = child.lines[0] if child.keys else block.lines[i]
+            if not block.lines[i] <= child_start < ends[i]:
+                raise _Unsupported(f"nested block out of item at line {child_start}")
+            if child.own_start:
+                # comments between a key and its nested block go with the first item
+                # (unless they follow an inline comment of the key)
+                child_start = _scan_back(lines, child_start, block.lines[i] + 1)
+            chunk.extend(lines[starts[i] : child_start])
+            _render(lines, child, child_start, ends[i], orders, chunk)
+        chunks.append(chunk)
+
+    order = orders.get(id(block.obj))
+    if order is None:
+        for chunk in chunks:
+            out.extend(chunk)
+        return
+
+    if isinstance(block.obj, CommentedMap):
+        indices = {key: i for i, key in enumerate(block.keys)}
+        order = [indices[key] for key in order]
+    # the first item may share its line with the parent's dash: "- key: value"
+    column = block.column
+    prefix = lines[block.lines[0]][:column]
+    compact = bool(prefix.strip())
+    if compact and prefix.replace("-", " ").strip():
+        raise _Unsupported(f"unexpected text at line {block.lines[0] + 1}")
+    for position, i in enumerate(order):
+        chunk = chunks[i]
+        if compact and starts[i] == block.lines[i]:
+            chunk[0] = (prefix if position == 0 else " " * column) + chunk[0][column:]
+        elif compact and position == 0:
+            raise _Unsupported(f"comments before line {block.lines[i] + 1}")
+        out.extend(chunk)
+
+
+def _anchors_first(yaml: ruamel.yaml.YAML, text: str) -> bool:
+    """Check that anchors are still defined before their aliases."""
+    try:
+        yaml.compose(text)
+    except ruamel.yaml.composer.ComposerError:
+        return False
+    return True
+
+
+def splice_sort(yaml: ruamel.yaml.YAML, text: str, **options) -> str | None:
+    """Sort a YAML document by moving lines of its text.
+
+    The order is the same as of `deep_sort` with the same options,
+    and comments move in the same way. Lines are not changed except
+    compact items of sequences (the dash is kept at its place: "- key: value").
+
+    Args:
+        yaml (ruamel.yaml.YAML): instance to load the document
+        text (str): source document
+        **options: arguments for `deep_sort` (except `inplace`)
+
+    Returns:
+        str | None: sorted document or None if it must be dumped as usual
+    """
+    if options.get("unique"):
+        # dropped items would take their comments away
+        return None
+    if not text.endswith("\n"):
+        text += "\n"
+    documents = list(yaml.load_all(text))
+    if len(documents) != 1:
+        return None
+    obj = documents[0]
+    if not isinstance(obj, (CommentedMap, CommentedSeq)):
+        return text
+
+    lines = text.splitlines(keepends=True)
+    if any(line.startswith("...") for line in lines):
+        return None
+    options.pop("inplace", None)
+    try:
+        block = _collect(obj, lines, set())
+        unsafe_tail = _unsafe_tail(obj)
+        with record_orders() as orders:
+            deep_sort(obj, inplace=True, **options)
+        if not orders:
+            return text
+        if not block.keys:
+            raise _Unsupported("empty document")
+
+        # comments before the first item and after the last one
+        first = block.lines[0]
+        start = _scan_back(lines, first, 0)
+        end = _scan_back(lines, len(lines), first + 1)
+        if end < len(lines) and unsafe_tail:
+            raise _Unsupported("can't find comments at the end")
+        out = lines[:start]
+        _render(lines, block, start, end, orders, out)
+        out.extend(lines[end:])
+    except _Unsupported:
+        return None
+    target = "".join(out)
+    # the dumper moves anchors to the first alias, lines can't be moved so
+    if "*" in text and not _anchors_first(yaml, target):
+        return None
+    return target
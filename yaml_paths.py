@@ -0,0 +1,161 @@
+"""Paths in YAML documents and key order specified for them.
+
+Paths are written like JSON paths: `$` is the document itself, `.key` or
+`["key"]` is a value of a map, `[0]` is an item of a sequence and `.*` or
+`[*]` is any value or item:
+
+    $.spec.containers[*]
+    $.metadata.labels
+    $["key.with.dots"]
+"""
+
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+
+# Segment of a path for any key or index
+WILDCARD = ...
+
+_SEGMENT = re.compile(
+    r"""\.(?P<name>[^.\[\]]+)"""
+    r"""|\[(?:(?P<index>\d+)|(?P<any>\*)"""
+    r"""|"(?P<dquoted>[^"]*)"|'(?P<squoted>[^']*)')\]"""
+)
+
+
+def parse_path(expr: str) -> list[Any]:
+    """Split path into segments: keys (str), indices (int) and `WILDCARD`.
+
+    Raises:
+        ValueError: if `expr` is not a valid path
+    """
+    if not expr.startswith("$"):
+        raise ValueError(f"path must start with '$': {expr!r}")
+    segments: list[Any] = []
+    pos = 1
+    while pos < len(expr):
+        match = _SEGMENT.match(expr, pos)
+        if match is None:
+            raise ValueError(f"invalid path {expr!r} at position {pos}")
+        pos = match.end()
+        if match["index"] is not None:
+            segments.append(int(match["index"]))
+        elif match["any"] is not None or match["name"] == "*":
+            segments.append(WILDCARD)
+        elif match["name"] is not None:
+            segments.append(match["name"])
+        elif match["dquoted"] is not None:
+            segments.append(match["dquoted"])
+        else:
+            segments.append(match["squoted"])
+    return segments
+
+
+# Keys which can be written after a dot
+_NAME = re.compile(r"[^.\[\]'\"*][^.\[\]]*")
+
+
+def format_path(segments: Iterable[Any]) -> str:
+    """Join segments into a path (reverse for `parse_path`).
+
+    Keys which are not strings are written as text.
+    """
+    parts = ["$"]
+    for segment in segments:
+        if segment is WILDCARD:
+            parts.append("[*]")
+        elif isinstance(segment, int) and not isinstance(segment, bool):
+            parts.append(f"[{segment}]")
+        else:
+            name = str(segment)
+            if _NAME.fullmatch(name):
+                parts.append(f".{name}")
+            elif '"' not in name:
+                parts.append(f'["{name}"]')
+            else:
+                parts.append(f"['{name}']")
+    return "".join(parts)
+
+
+class _OrderNode:
+    """Node of the trie built by `KeyOrder`."""
+
+    __slots__ = ("children", "wildcard", "priority")
+
+    def __init__(self) -> None:
+        self.children: dict[Any, _OrderNode] = {}
+        self.wildcard: _OrderNode | None = None
+        # keys to put first, in this order
+        self.priority: list[Any] | None = None
+
+
+class KeyOrder:
+    """Keys to put first in maps at given paths, the other keys are sorted.
+
+    Patterns are compiled into a trie once, so sorting follows it level
+    by level instead of matching every pattern against every path.
+    If several patterns match a map, a key is preferred to a wildcard.
+
+        order = KeyOrder({
+            "$": ["apiVersion", "kind", "metadata", "spec"],
+            "$.spec.containers[*]": ["name", "image"],
+        })
+        obj_sorted = deep_sort(obj, order=order)
+
+    Args:
+        spec (dict[str, list[Any]]): keys to put first for path patterns
+    """
+
+    def __init__(self, spec: dict[str, list[Any]]) -> None:
+        self.spec = dict(spec)
+        self.root = _OrderNode()
+        for expr, keys in self.spec.items():
+            node = self.root
+            for segment in parse_path(expr):
+                if segment is WILDCARD:
+                    if node.wildcard is None:
+                        node.wildcard = _OrderNode()
+                    node = node.wildcard
+                else:
+                    node = node.children.setdefault(segment, _OrderNode())
+            node.priority = list(dict.fromkeys(keys))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.spec!r})"
+
+    @staticmethod
+    def descend(nodes: Iterable[_OrderNode], key: Any) -> tuple[_OrderNode, ...]:
+        """Get nodes for a value at `key` (or index) of a container at `nodes`."""
+        children = []
+        for node in nodes:
+            child = node.children.get(key)
+            if child is not None:
+                children.append(child)
+        for node in nodes:
+            if node.wildcard is not None:
+                children.append(node.wildcard)
+        return tuple(children)
+
+    @staticmethod
+    def priority(nodes: Iterable[_OrderNode]) -> list[Any] | None:
+        """Get keys to put first in a map at `nodes`, if any."""
+        return next((node.priority for node in nodes if node.priority), None)
+
+
+@dataclass(slots=True)
+class Unsorted:
+    """Map or sequence which is not sorted, see `comments_sort.check_sorted`.
+
+    Attributes:
+        path (str): path to the container (see `format_path`)
+        key (Any): the first key (or index) which is out of order
+        line (int | None): line of the key in the source (starting from 1)
+    """
+
+    path: str
+    key: Any
+    line: int | None
+
+    def __str__(self) -> str:
+        return f"{self.path}: {self.key!r} is out of order"
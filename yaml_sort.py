@@ -0,0 +1,664 @@
+"""Command line tool to sort YAML files with comments.
+
+Usage:
+
+    python yaml_sort.py [options] FILE_OR_GLOB ...
+
+Files are handled one by one with the same `ruamel.yaml.YAML` instance
+(one instance per worker process with `--jobs`).
+
+The tool is run from git hooks often, so `ruamel.yaml`, the sorting code
+and `multiprocessing` are imported when they are needed: `--help` and
+an empty list of files don't import them at all. With `--server` files are
+sorted by a running server (see `sort_server`) instead.
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import ruamel.yaml
+    from comments_sort import SortStats
+    from sort_cache import SortCache
+    from yaml_paths import KeyOrder, Unsorted
+
+
+def _ignore_case(key: Any) -> str:
+    return str(key).casefold()
+
+
+# Names of key functions for map keys (and sequence items), see `--key`
+KEYS = ["plain", "ignore-case", "natural", "version"]
+
+
+def key_function(name: str) -> Callable[[Any], Any] | None:
+    """Get key function by name from `KEYS`."""
+    if name == "plain":
+        return None
+    if name == "ignore-case":
+        return _ignore_case
+    from comments_sort import natural_key, version_key
+
+    return {"natural": natural_key, "version": version_key}[name]
+
+
+def expand_paths(patterns: list[str]) -> list[str]:
+    """Expand glob patterns (`**` is supported) into list of paths.
+
+    Patterns without wildcards are kept as is, so missing files are reported later.
+    Duplicates are removed, the order is kept.
+    """
+    paths: dict[str, None] = {}
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.update(dict.fromkeys(sorted(glob.glob(pattern, recursive=True))))
+        else:
+            paths[pattern] = None
+    return list(paths)
+
+
+def sort_text(
+    yaml: "ruamel.yaml.YAML", text: str, minimal_diff: bool = False, **options
+) -> str:
+    """Sort YAML documents given as a string.
+
+    Args:
+        yaml (ruamel.yaml.YAML): instance to load and dump documents
+        text (str): source documents
+        minimal_diff (bool): move lines of the source (see `splice_sort`) instead
+            of dumping if possible
+        **options: arguments for `deep_sort`
+
+    Returns:
+        str: sorted documents
+    """
+    from comments_sort import current_stats, sort_all
+    from text_splice import splice_sort
+
+    stats = current_stats()
+    if stats is not None:
+        start = time.perf_counter()
+        other_phases = sum(stats.timings.values())
+
+    if minimal_diff:
+        target = splice_sort(yaml, text, **options)
+        if stats is not None:
+            # the document is loaded and sorted, the rest is for splicing
+            other_phases = sum(stats.timings.values()) - other_phases
+            stats.timings["splice"] += time.perf_counter() - start - other_phases
+            start = time.perf_counter()
+            other_phases = sum(stats.timings.values())
+        if target is not None:
+            return target
+
+    stream = io.StringIO()
+    yaml.dump_all(sort_all(yaml, text, inplace=True, **options), stream)
+
+    if stats is not None:
+        # documents are loaded and sorted while dumping, the rest is for dump
+        other_phases = sum(stats.timings.values()) - other_phases
+        stats.timings["dump"] += time.perf_counter() - start - other_phases
+    return stream.getvalue()
+
+
+@dataclass
+class FileResult:
+    """Result of sorting a file.
+
+    `source` and `target` are None if the file can't be handled (see `error`).
+    Only checked files (see `sort_file`) have `unsorted` instead of `target`.
+    """
+
+    path: str
+    source: str | None = None
+    target: str | None = None
+    error: str | None = None
+    # `SortStats.as_dict()` if statistics are collected
+    stats: dict[str, Any] | None = None
+    unsorted: "list[Unsorted] | None" = None
+
+    @property
+    def changed(self) -> bool:
+        if self.unsorted is not None:
+            return bool(self.unsorted)
+        return self.error is None and self.source != self.target
+
+
+# `ruamel.yaml.YAML` instance of the current process, see `_get_yaml`
+_yaml: "ruamel.yaml.YAML | None" = None
+
+
+def _get_yaml(allow_duplicate_keys: bool = False) -> "ruamel.yaml.YAML":
+    global _yaml
+    if _yaml is None:
+        import ruamel.yaml
+
+        _yaml = ruamel.yaml.YAML()
+    _yaml.allow_duplicate_keys = allow_duplicate_keys
+    return _yaml
+
+
+def sort_file(
+    path: str,
+    cache: "SortCache | None" = None,
+    stats: bool = False,
+    check: bool = False,
+    minimal_diff: bool = False,
+    source: str | None = None,
+    pause_gc: bool = False,
+    with_target: bool = False,
+    **options,
+) -> FileResult:
+    """Sort YAML file, the file itself is not changed.
+
+    Args:
+        path (str): path to the file
+        cache (SortCache | None): cache of sorted documents for the same `options`
+        stats (bool): collect statistics of sorting
+        check (bool): only find unsorted containers with `check_sorted`,
+            documents are not sorted and dumped
+        minimal_diff (bool): move lines of the source instead of dumping
+            if possible (see `sort_text`)
+        source (str | None): content of the file if it's already read
+            (e.g. unsaved buffer of an editor), the file isn't read then
+        pause_gc (bool): pause garbage collection of the whole process while
+            comments are moved (see `comments_sort.pause_gc`)
+        with_target (bool): with `check`, sort files which have unsorted
+            containers too (e.g. to show diffs), the result is still `changed`
+            only if the order is wrong
+        **options: arguments for `deep_sort`
+
+    Returns:
+        FileResult: sorted document (or unsorted containers) or error
+    """
+    import ruamel.yaml
+    from comments_sort import check_all, collect_stats
+
+    if pause_gc:
+        import comments_sort
+
+        with comments_sort.pause_gc():
+            return sort_file(
+                path,
+                cache,
+                stats,
+                check,
+                minimal_diff,
+                source,
+                with_target=with_target,
+                **options,
+            )
+
+    if stats:
+        with collect_stats() as file_stats:
+            result = sort_file(
+                path,
+                cache,
+                check=check,
+                minimal_diff=minimal_diff,
+                source=source,
+                with_target=with_target,
+                **options,
+            )
+        result.stats = file_stats.as_dict()
+        return result
+
+    global _yaml
+    try:
+        if source is None:
+            with open(path, encoding="utf-8") as f:
+                source = f.read()
+        target = cache.get(source) if cache is not None else None
+        yaml = _get_yaml(allow_duplicate_keys=options.get("unique", False))
+        unsorted = None
+        if check:
+            unsorted = check_all(yaml, source, **options) if target != source else []
+            if not (with_target and unsorted):
+                return FileResult(path, source, unsorted=unsorted)
+        if target is None:
+            target = sort_text(yaml, source, minimal_diff, **options)
+            if cache is not None:
+                cache.put(source, target)
+    # `UnicodeDecodeError` of files which aren't UTF-8 is a `ValueError`
+    except (OSError, ruamel.yaml.YAMLError, TypeError, ValueError) as e:
+        # `YAML` instance can't be used after an error in the middle of `dump_all`
+        _yaml = None
+        return FileResult(path, error=str(e))
+    except Exception as e:
+        # e.g. `RecursionError` for deeply nested documents, other files
+        # of the batch (and workers with `--jobs`) go on
+        _yaml = None
+        return FileResult(path, error=f"{type(e).__name__}: {e}")
+    except BaseException:
+        _yaml = None
+        raise
+    return FileResult(path, source, target, unsorted=unsorted)
+
+
+def sort_files(
+    paths: list[str],
+    *,
+    jobs: int = 1,
+    cache: "SortCache | None" = None,
+    stats: bool = False,
+    check: bool = False,
+    minimal_diff: bool = False,
+    pause_gc: bool = False,
+    with_target: bool = False,
+    **options,
+) -> Iterator[FileResult]:
+    """Sort YAML files, in parallel if `jobs` is not 1.
+
+    Every worker process loads and dumps documents with its own
+    `ruamel.yaml.YAML` instance. Key functions in `options` must be
+    picklable (i.e. defined at module level) for parallel sorting.
+
+    Args:
+        paths (list[str]): paths to files
+        jobs (int): number of worker processes, 0 - number of CPUs
+        cache (SortCache | None): cache of sorted documents for the same `options`
+        stats (bool): collect statistics of sorting for every file
+        check (bool): only find unsorted containers (see `sort_file`)
+        minimal_diff (bool): move lines of the source instead of dumping if possible
+        pause_gc (bool): pause garbage collection while comments are moved
+            (see `sort_file`)
+        with_target (bool): sort unsorted files with `check` (see `sort_file`)
+        **options: arguments for `deep_sort`
+
+    Returns:
+        Iterator[FileResult]: results in the same order as `paths`
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(paths) < 2:
+        for path in paths:
+            yield sort_file(
+                path,
+                cache,
+                stats,
+                check,
+                minimal_diff,
+                pause_gc=pause_gc,
+                with_target=with_target,
+                **options,
+            )
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # several files per task reduce overhead for many small files
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+        yield from executor.map(
+            partial(
+                sort_file,
+                cache=cache,
+                stats=stats,
+                check=check,
+                minimal_diff=minimal_diff,
+                pause_gc=pause_gc,
+                with_target=with_target,
+                **options,
+            ),
+            paths,
+            chunksize=chunksize,
+        )
+
+
+def load_order(path: str) -> "KeyOrder":
+    """Load key order (see `KeyOrder`) from YAML file with lists of keys for paths:
+
+        $: [apiVersion, kind, metadata, spec]
+        $.spec.containers[*]: [name, image]
+
+    Raises:
+        ValueError: if the file isn't a map of lists or paths are invalid
+    """
+    import ruamel.yaml
+
+    with open(path, encoding="utf-8") as f:
+        spec = ruamel.yaml.YAML(typ="safe").load(f)
+    return parse_order(spec)
+
+
+def parse_order(spec: Any) -> "KeyOrder":
+    """Make key order from a map of paths to lists of keys (see `load_order`).
+
+    Raises:
+        ValueError: if `spec` isn't a map of lists or paths are invalid
+    """
+    from yaml_paths import KeyOrder
+
+    if not isinstance(spec, dict) or not all(
+        isinstance(keys, list) for keys in spec.values()
+    ):
+        raise ValueError("key order must be a map of paths to lists of keys")
+    for expr, keys in spec.items():
+        if not isinstance(expr, str):
+            raise ValueError(f"path of key order must be a string: {expr!r}")
+        for key in keys:
+            try:
+                hash(key)
+            except TypeError:
+                raise ValueError(f"{expr}: key must be a scalar: {key!r}") from None
+    return KeyOrder(spec)
+
+
+def _sort_files_remote(
+    socket_path: str,
+    paths: list[str],
+    check: bool,
+    with_target: bool,
+    options: dict[str, Any],
+) -> Iterator[FileResult]:
+    """Sort files with the server (see `sort_server`) listening on `socket_path`.
+
+    Files are read here, so relative paths don't depend on the directory
+    of the server. Options are sent by name (see `sort_server`). Arguments
+    `check` and `with_target` are the same as for `sort_file`.
+    """
+    from sort_server import Client
+    from yaml_paths import Unsorted
+
+    with Client(socket_path) as client:
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    source = f.read()
+            except (OSError, ValueError) as e:
+                yield FileResult(path, error=str(e))
+                continue
+            request = dict(path=path, text=source, options=options)
+            unsorted = None
+            if check:
+                response = client.request(dict(request, op="check"))
+                if response["error"] is not None:
+                    yield FileResult(path, error=response["error"])
+                    continue
+                unsorted = [Unsorted(**item) for item in response["unsorted"]]
+                if not (with_target and unsorted):
+                    yield FileResult(path, source, unsorted=unsorted)
+                    continue
+            response = client.request(dict(request, op="sort"))
+            if response["error"] is not None:
+                yield FileResult(path, error=response["error"])
+            else:
+                yield FileResult(path, source, response["text"], unsorted=unsorted)
+
+
+def _diff(path: str, source: str, target: str) -> str:
+    import difflib
+
+    return "".join(
+        difflib.unified_diff(
+            source.splitlines(keepends=True),
+            target.splitlines(keepends=True),
+            fromfile=path,
+            tofile=path,
+        )
+    )
+
+
+def _non_negative(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer: {value!r}") from None
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return number
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="yaml-sort",
+        description="Sort YAML files keeping comments before their elements.",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        metavar="FILE",
+        help="files or globs, nothing is done without them",
+    )
+    mode = parser.add_argument_group("mode")
+    mode.add_argument(
+        "--check",
+        action="store_true",
+        help="report unsorted maps and sequences, exit with 1 if any file is not "
+        "sorted; only the order is checked, not formatting, with --diff or "
+        "--in-place only such files are shown or rewritten",
+    )
+    mode.add_argument(
+        "-i",
+        "--in-place",
+        action="store_true",
+        help="rewrite files which are changed",
+    )
+    mode.add_argument(
+        "--diff",
+        action="store_true",
+        help="print unified diff for files which would be changed",
+    )
+    parser.add_argument(
+        "--minimal-diff",
+        action="store_true",
+        help="move lines of the source instead of dumping documents, so the rest "
+        "of formatting is kept (falls back to dumping for flow style and such)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_non_negative,
+        default=1,
+        metavar="N",
+        help="number of worker processes, 0 - number of CPUs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help="directory to cache results, unchanged files are not sorted again",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=_non_negative,
+        default=64,
+        metavar="MB",
+        help="size of the cache directory to keep (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print statistics of sorting (time of phases, counts) as JSON to stderr",
+    )
+    order = parser.add_argument_group("order")
+    order.add_argument(
+        "--key",
+        choices=KEYS,
+        default="plain",
+        help="how to compare map keys and sequence items (default: %(default)s)",
+    )
+    order.add_argument(
+        "-r", "--reverse", action="store_true", help="sort in descending order"
+    )
+    order.add_argument(
+        "--sort-seqs",
+        action="store_true",
+        help="sort sequences too (only maps are sorted by default)",
+    )
+    order.add_argument(
+        "--order",
+        metavar="FILE",
+        help="YAML file with keys to put first for paths, e.g. `$: [name, version]`",
+    )
+    order.add_argument(
+        "--unique",
+        action="store_true",
+        help="drop duplicate sequence items and map keys (equal with --key), "
+        "duplicate keys are allowed on load",
+    )
+    order.add_argument(
+        "--max-depth",
+        type=int,
+        default=None,
+        metavar="N",
+        help="the deepest level to sort, top level is 0",
+    )
+    server = parser.add_argument_group("server")
+    server.add_argument(
+        "--serve",
+        metavar="SOCKET",
+        help="run server on unix socket to sort files for clients (see --server) "
+        "until interrupted",
+    )
+    server.add_argument(
+        "--server",
+        metavar="SOCKET",
+        help="sort files with the server running on unix socket, "
+        "--jobs, --cache-dir and --stats are not used",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Entry point for command line.
+
+    Returns:
+        int: exit code: 0 - success, 1 - some files are not sorted (`--check`),
+            2 - some files can't be handled
+    """
+    args = _parse_args(argv)
+    if args.serve:
+        from sort_server import serve
+
+        try:
+            serve(args.serve)
+        except OSError as e:
+            print(f"error: {args.serve}: {e}", file=sys.stderr)
+            return 2
+        return 0
+
+    paths = expand_paths(args.paths)
+    if not paths:
+        # e.g. no staged files in a hook, the sorting code isn't even imported
+        return 0
+    # the order decides with `--check`, only unsorted files are sorted and
+    # dumped then, checking is much faster than that
+    with_target = args.in_place or args.diff
+    if args.server:
+        remote_options = dict(
+            key=args.key,
+            reverse=args.reverse,
+            sort_seqs=args.sort_seqs,
+            max_depth=args.max_depth,
+            unique=args.unique,
+            minimal_diff=args.minimal_diff,
+            order_file=os.path.abspath(args.order) if args.order else None,
+        )
+        try:
+            return _print_results(
+                args,
+                _sort_files_remote(
+                    args.server, paths, args.check, with_target, remote_options
+                ),
+            )
+        except OSError as e:
+            print(f"error: {args.server}: {e}", file=sys.stderr)
+            return 2
+
+    import ruamel.yaml
+    from comments_sort import SortStats
+    from sort_cache import SortCache
+
+    key = key_function(args.key)
+    options = dict(
+        map_key=key,
+        seq_key=key,
+        reverse=args.reverse,
+        sort_seqs=args.sort_seqs,
+        max_depth=args.max_depth,
+        unique=args.unique,
+    )
+    if args.order:
+        try:
+            options["order"] = load_order(args.order)
+        except (OSError, ruamel.yaml.YAMLError, ValueError) as e:
+            print(f"error: {args.order}: {e}", file=sys.stderr)
+            return 2
+
+    cache = None
+    if args.cache_dir:
+        # results differ in formatting
+        cache_options = dict(options, minimal_diff=args.minimal_diff)
+        cache = SortCache(
+            args.cache_dir, cache_options, max_size=args.cache_size * 2**20
+        )
+
+    stats = SortStats() if args.stats else None
+    results = sort_files(
+        paths,
+        jobs=args.jobs,
+        cache=cache,
+        stats=args.stats,
+        check=args.check,
+        minimal_diff=args.minimal_diff,
+        # the process only sorts files
+        pause_gc=True,
+        with_target=with_target,
+        **options,
+    )
+    exit_code = _print_results(args, results, stats)
+    if cache is not None:
+        cache.prune()
+    if stats is not None:
+        print(stats.to_json(), file=sys.stderr)
+    return exit_code
+
+
+def _print_results(
+    args: argparse.Namespace,
+    results: Iterator[FileResult],
+    stats: "SortStats | None" = None,
+) -> int:
+    """Print (or write) results according to the mode of `args`.
+
+    Returns:
+        int: exit code, see `main`
+    """
+    exit_code = 0
+    for result in results:
+        path = result.path
+        if result.stats is not None:
+            stats.update(result.stats)
+        if result.error is not None:
+            print(f"error: {path}: {result.error}", file=sys.stderr)
+            exit_code = 2
+            continue
+
+        if not (args.check or args.in_place or args.diff):
+            sys.stdout.write(result.target)
+            continue
+        if not result.changed:
+            continue
+        if args.diff:
+            sys.stdout.write(_diff(path, result.source, result.target))
+        if args.in_place:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(result.target)
+        if args.check:
+            for unsorted in result.unsorted or ():
+                line = f"{unsorted.line}:" if unsorted.line is not None else ""
+                print(f"{path}:{line} {unsorted}", file=sys.stderr)
+            print(f"would sort {path}", file=sys.stderr)
+            exit_code = max(exit_code, 1)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())